@@ -11,7 +11,7 @@ Original file is located at
 
 from lenskit.algorithms import Recommender
 from lenskit.algorithms.bias import Bias
-from lenskit import batch, topn, util
+from lenskit import topn, util
 import pandas as pd
 import joblib
 import gzip
@@ -19,6 +19,19 @@ import json
 from lenskit import crossfold as xf
 import seedbank
 
+# Shared helpers from the repository root (clone it next to the datasets on Drive)
+import sys
+sys.path.append('/content/drive/MyDrive/Master Thesis/RecSoGood2024')
+from recsogood import parallel
+from recsogood.cleaning import clean_interactions
+from recsogood.datasets import read_amazon_ratings
+from recsogood.energy import EnergyRecorder
+from recsogood.metrics import ndcg_scores
+from recsogood.models import save_model
+from recsogood.pruning import prune_k_core
+from recsogood.sampling import portion_frame
+from recsogood.stats import cached_stats, print_stats
+
 """
 Previous Behavior (Before Update):
 Before the modification, the nDCG_LK class in LensKit used the following approach:
@@ -41,142 +54,32 @@ Conclusion:
 Previous Behavior: Always used IDCG@n, regardless of the actual number of rated items.
 Updated Behavior: Uses IDCG@hist_len, where hist_len is the number of items actually rated by the user.
 """
-import numpy as np
-
-class nDCG_LK:
-    def __init__(self, n, top_items, test_items):
-        self.n = n
-        self.top_items = top_items
-        self.test_items = test_items
-
-    def _ideal_dcg(self):
-        iranks = np.zeros(self.n, dtype=np.float64)
-        iranks[:] = np.arange(1, self.n + 1)
-        idcg = np.cumsum(1.0 / np.log2(iranks + 1), axis=0)
-        if len(self.test_items) < self.n:
-            idcg[len(self.test_items):] = idcg[len(self.test_items) - 1]
-        return idcg[self.n - 1]
-
-    def calculate_dcg(self):
-        dcg = 0
-        for i, item in enumerate(self.top_items):
-            if item in self.test_items:
-                relevance = 1
-            else:
-                relevance = 0
-            rank = i + 1
-            contribution = relevance / np.log2(rank + 1)
-            dcg += contribution
-        return dcg
-
-    def calculate(self):
-        dcg = self.calculate_dcg()
-        ideal_dcg = self._ideal_dcg()
-        if ideal_dcg == 0:
-            return 0
-        ndcg = dcg / ideal_dcg
-        return ndcg
 
 seedbank.initialize(42)
 
-# Function to load the JSON data
-def load_json_data(file_path, chunksize=10000):
-    chunks = pd.read_json(file_path, lines=True, compression='gzip', chunksize=chunksize)
-    return pd.concat(chunks, ignore_index=True)
-
 # Load and preprocess ratings data
 file_path = '/content/drive/MyDrive/Master Thesis/Dataset/Amazon/Toys_and_Games_5.json.gz'
-ratings = load_json_data(file_path)
-print(len(ratings))
-ratings = ratings.rename(columns={'reviewerID': 'user', 'asin': 'item', 'overall': 'rating'})
-ratings = ratings.dropna(subset=['rating'])
-# Convert 'rating' column to float
-ratings['rating'] = ratings['rating'].astype(float)
-# Keep only the necessary columns
-ratings = ratings[['user', 'item', 'rating']]
+# Stream the gzipped JSON lines keeping only reviewerID/asin/overall, with ids factorized to int32 codes
+ratings, user_index, item_index = read_amazon_ratings(file_path)
 print(ratings.head())
 print(len(ratings))
 
-# Convert user and item IDs to integers
-ratings['user'], user_index = pd.factorize(ratings['user'])
-ratings['item'], item_index = pd.factorize(ratings['item'])
-print(ratings.head())
-print(len(ratings))
+# Inspect the ratings data: counts, users and items below 10 interactions, empty and duplicate
+# rows, degree histograms, sparsity, item-popularity Gini and rating distribution from one pass
+# (cached next to the dataset, so reruns skip it)
+ratings_stats = cached_stats(file_path, ratings, stage='raw')
+print_stats(ratings_stats, "Initial Ratings Data Inspection:")
 
-# Inspect the ratings data
-print("Initial Ratings Data Inspection:")
-print("Number of interactions:", len(ratings))
-print("Number of unique users:", ratings['user'].nunique())
-print("Number of unique items:", ratings['item'].nunique())
-
-# Check for users and items with fewer than 10 interactions
-user_counts = ratings['user'].value_counts()
-item_counts = ratings['item'].value_counts()
-
-print("\nUsers with fewer than 10 interactions:", (user_counts < 10).sum())
-print("Items with fewer than 10 interactions:", (item_counts < 10).sum())
-
-# Check for empty rows
-empty_rows = ratings.isnull().sum().sum()
-print("\nNumber of empty rows:", empty_rows)
-
-# Check for duplicate rows
-duplicate_rows = ratings.duplicated().sum()
-print("Number of duplicate rows:", duplicate_rows)
-# Check for duplicate ratings (same user, same item)
-duplicate_ratings = ratings.duplicated(subset=['user', 'item']).sum()
-print("Number of duplicate ratings (same user, same item):", duplicate_ratings)
-
-# Remove duplicate rows
-ratings = ratings.drop_duplicates()
-# Aggregate duplicate ratings (same user, same item) by averaging their ratings
-ratings = ratings.groupby(['user', 'item'], as_index=False)['rating'].mean()
-
-# Check for empty rows after cleaning
-empty_rows = ratings.isnull().sum().sum()
-print("\nNumber of empty rows after cleaning:", empty_rows)
-
-# Check for duplicate rows after cleaning
-duplicate_rows = ratings.duplicated().sum()
-print("Number of duplicate rows after cleaning:", duplicate_rows)
-
-# Check for duplicate ratings (same user, same item) after cleaning
-duplicate_ratings = ratings.duplicated(subset=['user', 'item']).sum()
-print("Number of duplicate ratings (same user, same item) after cleaning:", duplicate_ratings)
-
-# 10-core pruning
-def prune_10_core(data):
-    while True:
-        # Filter users with fewer than 10 interactions
-        user_counts = data['user'].value_counts()
-        valid_users = user_counts[user_counts >= 10].index
-        data = data[data['user'].isin(valid_users)]
-
-        # Filter items with fewer than 10 interactions
-        item_counts = data['item'].value_counts()
-        valid_items = item_counts[item_counts >= 10].index
-        data = data[data['item'].isin(valid_items)]
-
-        # Check if no more pruning is needed
-        if all(user_counts >= 10) and all(item_counts >= 10):
-            break
-    return data
-
-# Apply 10-core pruning
-ratings = prune_10_core(ratings)
+# Drop empty rows, remove duplicate rows and average duplicate ratings (same user, same item)
+# in one sorted pass (its counts are in the inspection report above)
+ratings, _ = clean_interactions(ratings)
 
-# Inspect the pruned ratings data
-print("\nAfter Pruning:")
-print("Number of interactions:", len(ratings))
-print("Number of unique users:", ratings['user'].nunique())
-print("Number of unique items:", ratings['item'].nunique())
+# 10-core pruning (degree-counter peeling, linear in the number of interactions)
+ratings, prune_stats = prune_k_core(ratings, 10)
+print("\n10-core pruning:", prune_stats['rounds'], "rounds,", prune_stats['removed_interactions'], "interactions removed")
 
-# Check for users and items with fewer than 10 interactions after pruning
-user_counts = ratings['user'].value_counts()
-item_counts = ratings['item'].value_counts()
-
-print("\nUsers with fewer than 10 interactions after pruning:", (user_counts < 10).sum())
-print("Items with fewer than 10 interactions after pruning:", (item_counts < 10).sum())
+# Inspect the pruned ratings data
+print_stats(cached_stats(file_path, ratings, stage='10-core'), "\nAfter Pruning:")
 
 # Split into train and test sets
 final_test_method = xf.SampleFrac(0.10, rng_spec=42)
@@ -225,15 +128,10 @@ print("Validation Data - Number of Users:", validation_data['user'].nunique())
 print("Final Test Data - Number of Users:", final_test_data['user'].nunique())
 
 
-# Downsample the training set to different% of interactions for each user using xf.SampleFrac
-downsample_method = xf.SampleFrac(1.0 - 0.1, rng_spec=42)
-downsampled_train_parts = []
-
-for i, tp in enumerate(xf.partition_users(pure_train_data, 1, downsample_method)):
-    downsampled_train_parts.append(tp.train)
-
-# Combine downsampled train parts into one DataFrame
-downsampled_train_data = pd.concat(downsampled_train_parts)
+# Downsample the training set to a portion (10% - 100%) of each user's interactions. All portions
+# come from one seeded per-user permutation, so the 10% portion is contained in the 20% one, etc.
+train_portion = 0.1
+downsampled_train_data = portion_frame(pure_train_data, train_portion, seed=42)
 
 # Checks for number of interactions and users in each set after downsampling
 print("\nAfter Downsampling:")
@@ -250,17 +148,12 @@ def evaluate_with_ndcg(aname, algo, train, valid):
     fittable = Recommender.adapt(fittable)
     fittable.fit(train)
     users = valid.user.unique()
-    recs = batch.recommend(fittable, users, 10)
+    # Shard the users over a fork-inherited worker pool (RECSOGOOD_JOBS workers)
+    recs = parallel.recommend(fittable, users, 10)
     recs['Algorithm'] = aname
 
-    total_ndcg = 0
-    for user in users:
-        user_recs = recs[recs['user'] == user]['item'].values
-        user_truth = valid[valid['user'] == user]['item'].values
-        ndcg_score = nDCG_LK(10, user_recs, user_truth).calculate()
-        total_ndcg += ndcg_score
-
-    mean_ndcg = total_ndcg / len(users)
+    # Score every user in one grouped pass (same values as nDCG_LK per user)
+    user_ndcg, mean_ndcg = ndcg_scores(recs, valid, 10)
     return recs, mean_ndcg
 
 # Perform validation and compute nDCG
@@ -271,6 +164,23 @@ print(f"NDCG mean for validation set: {mean_ndcg:.4f}")
 # Fit the algorithm on the full training data
 final_algo = Bias(damping = 1000)
 
-# Use evaluate_with_ndcg to get recommendations and mean nDCG
-final_recs, mean_ndcg = evaluate_with_ndcg('Bias', final_algo, downsampled_train_data, final_test_data)
-print(f"NDCG mean for test set: {mean_ndcg:.4f}")
\ No newline at end of file
+# Measure time, memory and energy of the final fit, recommendation and evaluation
+energy = EnergyRecorder(dataset='toys-and-games', algorithm='Bias', portion=train_portion)
+
+# Fit the final model once and store it (memory-mappable, see recsogood.models) so the
+# test set or other cutoffs can be rescored later with load_model instead of refitting
+final_model = Recommender.adapt(util.clone(final_algo))
+with energy.measure('fit'):
+    final_model.fit(downsampled_train_data)
+save_model(final_model, f'/content/drive/MyDrive/Master Thesis/Models/toys-and-games/bias_{train_portion}')
+
+with energy.measure('recommend'):
+    final_recs = parallel.recommend(final_model, final_test_data.user.unique(), 10)
+final_recs['Algorithm'] = 'Bias'
+with energy.measure('evaluate'):
+    user_ndcg, mean_ndcg = ndcg_scores(final_recs, final_test_data, 10)
+print(f"NDCG mean for test set: {mean_ndcg:.4f}")
+
+# One row per stage with the test nDCG, appended to a table shared by all runs
+energy_table = energy.append_csv('/content/drive/MyDrive/Master Thesis/Results/energy.csv', ndcg=mean_ndcg)
+print(energy_table.to_string(index=False))
\ No newline at end of file
@@ -14,109 +14,58 @@ import recpack.pipelines as pipelines
 from recpack.scenarios import WeakGeneralization
 from recpack.preprocessing.filters import MinItemsPerUser, MinUsersPerItem, Deduplicate
 import numpy as np
-import pandas as pd
 import joblib
 import gzip
 import json
-from recpack.preprocessing.preprocessors import DataFramePreprocessor
 
-# Function to load the JSON data
-def load_json_data(file_path, chunksize=10000):
-    chunks = pd.read_json(file_path, lines=True, compression='gzip', chunksize=chunksize)
-    return pd.concat(chunks, ignore_index=True)
+# Shared helpers from the repository root (clone it next to the datasets on Drive)
+import sys
+sys.path.append('/content/drive/MyDrive/Master Thesis/RecSoGood2024')
+from recsogood.cache import cached_frame
+from recsogood.cleaning import clean_interactions
+from recsogood.datasets import read_amazon_ratings
+from recsogood.interactions import Interactions
+from recsogood.knn import recpack_itemknn
+from recsogood.pruning import prune_k_core
+from recsogood.stats import cached_stats, print_stats
+
 # Set random seed for reproducibility
 np.random.seed(42)
 # Load and preprocess ratings data
 file_path = '/content/drive/MyDrive/Master Thesis/Dataset/Amazon/Toys_and_Games_5.json.gz'
-ratings = load_json_data(file_path)
-print(len(ratings))
-
-# Rename columns to match RecPack expectations
-ratings = ratings.rename(columns={'reviewerID': 'user_id', 'asin': 'item_id', 'overall': 'rating'})
-ratings = ratings.dropna(subset=['rating'])
-
-# Convert 'rating' column to float
-ratings['rating'] = ratings['rating'].astype(float)
-# Keep only the necessary columns
-ratings = ratings[['user_id', 'item_id', 'rating']]
-print(ratings.head())
-print(len(ratings))
-
-# Convert user and item IDs to integers
-ratings['user_id'], user_index = pd.factorize(ratings['user_id'])
-ratings['item_id'], item_index = pd.factorize(ratings['item_id'])
-print(ratings.head())
-print(len(ratings))
+# Read, inspect, clean and 10-core prune the ratings once; later runs load the result memory
+# mapped from .recsogood_cache next to the dataset (rebuilt when the file or these options change)
+def preprocess():
+    # Stream the gzipped JSON lines keeping only reviewerID/asin/overall, with ids factorized to int32 codes
+    ratings, _, _ = read_amazon_ratings(file_path, user_col='user_id', item_col='item_id')
+    print(ratings.head())
+    print(len(ratings))
 
-# Inspect the ratings data
-print("Initial Ratings Data Inspection:")
-print("Number of interactions:", len(ratings))
-print("Number of unique users:", ratings['user_id'].nunique())
-print("Number of unique items:", ratings['item_id'].nunique())
+    # Inspect the ratings data: counts, users and items below 10 interactions, empty and duplicate
+    # rows, degree histograms, sparsity, item-popularity Gini and rating distribution from one pass
+    # (printed when the preprocessed ratings are not cached yet)
+    ratings_stats = cached_stats(file_path, ratings, user_col='user_id', item_col='item_id', stage='raw')
+    print_stats(ratings_stats, "Initial Ratings Data Inspection:")
 
-# Check for users and items with fewer than 10 interactions
-user_counts = ratings['user_id'].value_counts()
-item_counts = ratings['item_id'].value_counts()
+    # Drop empty rows, remove duplicate rows and average duplicate ratings (same user, same item)
+    # in one sorted pass (its counts are in the inspection report above)
+    ratings, _ = clean_interactions(ratings, user_col='user_id', item_col='item_id')
 
-print("\nUsers with fewer than 10 interactions:", (user_counts < 10).sum())
-print("Items with fewer than 10 interactions:", (item_counts < 10).sum())
+    print(len(ratings))
 
-# Check for empty rows
-empty_rows = ratings.isnull().sum().sum()
-print("\nNumber of empty rows:", empty_rows)
+    # 10-core pruning (degree-counter peeling, linear in the number of interactions)
+    ratings, prune_stats = prune_k_core(ratings, 10, user_col='user_id', item_col='item_id')
+    print("\n10-core pruning:", prune_stats['rounds'], "rounds,", prune_stats['removed_interactions'], "interactions removed")
+    return ratings
 
-# Check for duplicate rows
-duplicate_rows = ratings.duplicated().sum()
-print("Number of duplicate rows:", duplicate_rows)
-# Check for duplicate ratings (same user, same item)
-duplicate_ratings = ratings.duplicated(subset=['user_id', 'item_id']).sum()
-print("Number of duplicate ratings (same user, same item):", duplicate_ratings)
 
-# Remove duplicate rows
-ratings = ratings.drop_duplicates()
-# Aggregate duplicate ratings (same user, same item) by averaging their ratings
-ratings = ratings.groupby(['user_id', 'item_id'], as_index=False)['rating'].mean()
-
-# Check for empty rows after cleaning
-empty_rows = ratings.isnull().sum().sum()
-print("\nNumber of empty rows after cleaning:", empty_rows)
-
-# Check for duplicate rows after cleaning
-duplicate_rows = ratings.duplicated().sum()
-print("Number of duplicate rows after cleaning:", duplicate_rows)
-
-# Check for duplicate ratings (same user, same item) after cleaning
-duplicate_ratings = ratings.duplicated(subset=['user_id', 'item_id']).sum()
-print("Number of duplicate ratings (same user, same item) after cleaning:", duplicate_ratings)
+ratings = cached_frame(file_path, preprocess, clean=True, core=10, user_col='user_id', item_col='item_id')
 
 print(len(ratings))
 
-# 10-core pruning
-def prune_10_core(data):
-    while True:
-        # Filter users with fewer than 10 interactions
-        user_counts = data['user_id'].value_counts()
-        valid_users = user_counts[user_counts >= 10].index
-        data = data[data['user_id'].isin(valid_users)]
-
-        # Filter items with fewer than 10 interactions
-        item_counts = data['item_id'].value_counts()
-        valid_items = item_counts[item_counts >= 10].index
-        data = data[data['item_id'].isin(valid_items)]
-
-        # Check if no more pruning is needed
-        if all(user_counts >= 10) and all(item_counts >= 10):
-            break
-    return data
-# Apply 10-core pruning
-ratings = prune_10_core(ratings)
-
-print(len(ratings))
-
-# Preprocess the data using RecPack
-proc = DataFramePreprocessor(item_ix='item_id', user_ix='user_id')
-# Process the DataFrame to get the interaction matrix
-interaction_matrix = proc.process(ratings)
+# Build the CSR interaction store once and view it as a RecPack InteractionMatrix
+# (the store's user and item codes are used as they are, no second pass to map the ids)
+interaction_matrix = Interactions.from_frame(ratings, user_col='user_id', item_col='item_id').to_recpack()
 
 # Print the number of interactions, users, and items before splitting
 print("Number of interactions in the original set:", interaction_matrix.num_interactions)
@@ -192,9 +141,15 @@ pipeline_builder.set_test_data((downsampled_train_interactions, test_out_interac
 pipeline_builder.set_validation_training_data(downsampled_train_interactions)
 pipeline_builder.set_validation_data((downsampled_train_interactions, valid_interactions))
 
+# ItemKNN with the same similarities and scores as RecPack's, but fitted in blocks within 2 GB
+# and spilled to a memory-mapped neighbour file on the local disk: the K=200 neighbours are
+# computed once and every K of the grid reads its top-K slice, so no dense item x item matrix
+# is built
+recpack_itemknn('/content/neighbors/amazon-toys-itemknn', k_max=200, memory_mb=2048)
+
 # Add ItemKNN algorithm with hyperparameter ranges for optimization
 pipeline_builder.add_algorithm(
-    'ItemKNN',
+    'ChunkedItemKNN',
     grid={
         'K': [10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 150, 200],  # Range of K values for optimization
     }
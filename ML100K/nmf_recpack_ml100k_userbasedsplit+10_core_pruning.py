@@ -14,8 +14,17 @@ import recpack.pipelines as pipelines
 from recpack.scenarios import WeakGeneralization
 from recpack.datasets import MovieLens100K
 import numpy as np
-import pandas as pd
-from recpack.preprocessing.preprocessors import DataFramePreprocessor
+
+# Shared helpers from the repository root (clone it next to the datasets on Drive)
+import sys
+sys.path.append('/content/drive/MyDrive/Master Thesis/RecSoGood2024')
+from recsogood.cache import cached_frame
+from recsogood.cleaning import clean_interactions
+from recsogood.datasets import read_movielens
+from recsogood.interactions import Interactions
+from recsogood.pruning import prune_k_core
+from recsogood.scoring import recpack_factorization
+from recsogood.stats import cached_stats, print_stats
 
 # Set random seed for reproducibility
 np.random.seed(42)
@@ -24,94 +33,44 @@ np.random.seed(42)
 # Specify the path where the dataset should be saved
 dataset_path = '/content/drive/MyDrive/Master Thesis/Dataset/ml-100k/u.data'
 
-# Load the dataset into a DataFrame directly
-column_names = ['user_id', 'item_id', 'rating', 'timestamp']
-ratings = pd.read_csv(dataset_path, sep='\t', names=column_names, usecols=['user_id', 'item_id', 'rating'])
-
-print(len(ratings))
-
-# Rename columns to match RecPack expectations
-ratings = ratings.rename(columns={'reviewerID': 'user_id', 'asin': 'item_id', 'overall': 'rating'})
-ratings = ratings.dropna(subset=['rating'])
-
-# Inspect the ratings data
-print("Initial Ratings Data Inspection:")
-print("Number of interactions:", len(ratings))
-print("Number of unique users:", ratings['user_id'].nunique())
-print("Number of unique items:", ratings['item_id'].nunique())
-
-# Check for users and items with fewer than 10 interactions
-user_counts = ratings['user_id'].value_counts()
-item_counts = ratings['item_id'].value_counts()
+# Read, inspect, clean and 10-core prune the ratings once; later runs load the result memory
+# mapped from .recsogood_cache next to the dataset (rebuilt when the file or these options change)
+def preprocess():
+    # Load the dataset into a DataFrame directly (int32 ids, float32 ratings, no timestamp)
+    ratings = read_movielens(dataset_path, user_col='user_id', item_col='item_id')
 
-print("\nUsers with fewer than 10 interactions:", (user_counts < 10).sum())
-print("Items with fewer than 10 interactions:", (item_counts < 10).sum())
+    print(len(ratings))
 
-# Check for empty rows
-empty_rows = ratings.isnull().sum().sum()
-print("\nNumber of empty rows:", empty_rows)
+    # Inspect the ratings data: counts, users and items below 10 interactions, empty and duplicate
+    # rows, degree histograms, sparsity, item-popularity Gini and rating distribution from one pass
+    # (printed when the preprocessed ratings are not cached yet)
+    ratings_stats = cached_stats(dataset_path, ratings, user_col='user_id', item_col='item_id', stage='raw')
+    print_stats(ratings_stats, "Initial Ratings Data Inspection:")
 
-# Check for duplicate rows
-duplicate_rows = ratings.duplicated().sum()
-print("Number of duplicate rows:", duplicate_rows)
-# Check for duplicate ratings (same user, same item)
-duplicate_ratings = ratings.duplicated(subset=['user_id', 'item_id']).sum()
-print("Number of duplicate ratings (same user, same item):", duplicate_ratings)
+    # Drop empty rows, remove duplicate rows and average duplicate ratings (same user, same item)
+    # in one sorted pass (its counts are in the inspection report above)
+    ratings, _ = clean_interactions(ratings, user_col='user_id', item_col='item_id')
 
-# Remove duplicate rows
-ratings = ratings.drop_duplicates()
-# Aggregate duplicate ratings (same user, same item) by averaging their ratings
-ratings = ratings.groupby(['user_id', 'item_id'], as_index=False)['rating'].mean()
+    print(len(ratings))
 
-# Check for empty rows after cleaning
-empty_rows = ratings.isnull().sum().sum()
-print("\nNumber of empty rows after cleaning:", empty_rows)
+    # 10-core pruning (degree-counter peeling, linear in the number of interactions)
+    ratings, prune_stats = prune_k_core(ratings, 10, user_col='user_id', item_col='item_id')
+    print("\n10-core pruning:", prune_stats['rounds'], "rounds,", prune_stats['removed_interactions'], "interactions removed")
+    return ratings
 
-# Check for duplicate rows after cleaning
-duplicate_rows = ratings.duplicated().sum()
-print("Number of duplicate rows after cleaning:", duplicate_rows)
 
-# Check for duplicate ratings (same user, same item) after cleaning
-duplicate_ratings = ratings.duplicated(subset=['user_id', 'item_id']).sum()
-print("Number of duplicate ratings (same user, same item) after cleaning:", duplicate_ratings)
+ratings = cached_frame(dataset_path, preprocess, clean=True, core=10, user_col='user_id', item_col='item_id')
 
 print(len(ratings))
 
-# 10-core pruning
-def prune_10_core(data):
-    while True:
-        # Filter users with fewer than 10 interactions
-        user_counts = data['user_id'].value_counts()
-        valid_users = user_counts[user_counts >= 10].index
-        data = data[data['user_id'].isin(valid_users)]
-
-        # Filter items with fewer than 10 interactions
-        item_counts = data['item_id'].value_counts()
-        valid_items = item_counts[item_counts >= 10].index
-        data = data[data['item_id'].isin(valid_items)]
-
-        # Check if no more pruning is needed
-        if all(user_counts >= 10) and all(item_counts >= 10):
-            break
-    return data
-# Apply 10-core pruning
-ratings = prune_10_core(ratings)
-
-print(len(ratings))
-
-# Save the preprocessed DataFrame to a new CSV file
-preprocessed_file_path = '/content/drive/MyDrive/Master Thesis/Dataset/ml-100k/preprocessed_ratings(for_RecPack).csv'
-ratings.to_csv(preprocessed_file_path, index=False)
-
-# Create an instance of MovieLens100K with the preprocessed file
+# Create an instance of MovieLens100K with the preprocessed ratings
 class CustomMovieLens100K(MovieLens100K):
     def _load_dataframe(self):
-        return pd.read_csv(preprocessed_file_path)
+        return cached_frame(dataset_path, preprocess, clean=True, core=10, user_col='user_id', item_col='item_id')
 
-# Preprocess the data using RecPack
-proc = DataFramePreprocessor(item_ix='item_id', user_ix='user_id')
-# Process the DataFrame to get the interaction matrix
-interaction_matrix = proc.process(ratings)
+# Build the CSR interaction store once and view it as a RecPack InteractionMatrix
+# (the store's user and item codes are used as they are, no second pass to map the ids)
+interaction_matrix = Interactions.from_frame(ratings, user_col='user_id', item_col='item_id').to_recpack()
 
 # Print the number of interactions, users, and items before splitting
 print("Number of interactions in the original set:", interaction_matrix.num_interactions)
@@ -189,9 +148,13 @@ pipeline_builder.set_test_data((downsampled_train_interactions, test_out_interac
 pipeline_builder.set_validation_training_data(downsampled_train_interactions)
 pipeline_builder.set_validation_data((downsampled_train_interactions, valid_interactions))
 
+# NMF with predictions that hold only each user's top-100 scores, computed in cache-sized
+# blocks of the factor matrices instead of a dense users x items matrix (NDCGK@10 is unchanged)
+recpack_factorization('NMF', n=100)
+
 # Add algorithm with hyperparameter ranges for optimization
 pipeline_builder.add_algorithm(
-    'NMF',
+    'BlockedNMF',
     grid={
         'num_components': [1, 3, 5, 7, 10, 15, 20, 25, 30, 35, 40, 50, 100],  # Range of number of components to test
         'alpha': [0, 0.001, 0.01, 0.1],
@@ -0,0 +1,5 @@
+"""Shared helpers for the RecSoGood2024 experiment scripts.
+
+The Colab scripts in the dataset folders import these modules after adding
+the repository root to ``sys.path``.
+"""
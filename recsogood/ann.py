@@ -0,0 +1,178 @@
+"""Approximate cosine neighbours by random-projection LSH.
+
+Exact neighbour search compares every user (or item) with every other one.
+``RandomProjectionLSH`` hashes each rating vector by the signs of its
+projections on ``n_bits`` random hyperplanes, in ``n_tables`` independent
+tables; two vectors become candidates when they share a bucket in any
+table, and only candidates are compared.  More bits make the buckets
+smaller (faster, lower recall), more tables give a pair more chances to
+meet (slower, higher recall).  Rating vectors are sparse and their
+neighbours have modest cosines, so few bits per table work best.  The
+similarities of the candidates are exact cosines, so an approximate
+neighbour list only misses neighbours, it never misranks them.
+
+``neighbor_recall`` measures how many of the exact top-k neighbours an
+approximate table found, ``recall_report`` does so for a list of settings
+together with their time and energy.  ``recsogood.knn.ItemKNN`` and
+``UserKNN`` take an index through their ``ann`` parameter.
+"""
+import numpy as np
+import pandas as pd
+import scipy.sparse as sps
+
+from .energy import EnergyRecorder
+from .knn import item_similarities
+
+
+def _unit_rows(vectors):
+    vectors = sps.csr_matrix(vectors, dtype=np.float32)
+    norms = np.sqrt(np.asarray(vectors.multiply(vectors).sum(axis=1)).ravel())
+    scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return sps.csr_matrix(sps.diags(scale.astype(np.float32)) @ vectors)
+
+
+def _top_k_rows(rows, columns, values, shape, k=None, unique=True):
+    # CSR with every row's entries by decreasing value, the first ``k`` kept;
+    # with ``unique`` false the (row, column) pairs are known to be distinct
+    if unique:
+        order = np.lexsort((columns, -values, rows))
+    else:
+        # one sort on a combined key: values are cosines in [-1, 1]
+        order = np.argsort(rows * 4.0 + (1.0 - values), kind='stable')
+    rows, columns, values = rows[order], columns[order], values[order]
+    if unique and len(rows):
+        # a pair found several times has the same value each time, so its copies are adjacent
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = (rows[1:] != rows[:-1]) | (columns[1:] != columns[:-1])
+        rows, columns, values = rows[first], columns[first], values[first]
+    counts = np.bincount(rows, minlength=shape[0])
+    if k is not None:
+        starts = np.cumsum(counts) - counts
+        keep = np.arange(len(rows)) - starts[rows] < k
+        rows, columns, values = rows[keep], columns[keep], values[keep]
+        counts = np.minimum(counts, k)
+    indptr = np.zeros(shape[0] + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    return sps.csr_matrix((values.astype(np.float32), columns.astype(np.int32), indptr), shape=shape)
+
+
+def _entries(matrix):
+    matrix = matrix.tocoo()
+    return matrix.row.astype(np.int64), matrix.col.astype(np.int64), matrix.data
+
+
+class RandomProjectionLSH:
+    """Sign-of-random-projection hash tables over the rows of a sparse matrix.
+
+    ``n_tables`` tables of ``n_bits`` hyperplanes each; the planes are drawn
+    from ``seed``.  ``fit`` hashes the rows, ``candidates`` lists the rows
+    that share a bucket with one row and ``neighbors`` gives the top-k
+    cosine neighbours of every row among its candidates.
+    """
+
+    def __init__(self, n_tables=16, n_bits=6, seed=42):
+        if not 1 <= n_bits <= 62:
+            raise ValueError("n_bits must be between 1 and 62")
+        if n_tables < 1:
+            raise ValueError("n_tables must be at least 1")
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.seed = seed
+
+    def get_params(self, deep=True):
+        """Constructor parameters (lets ``lenskit.util.clone`` copy the index)."""
+        return {'n_tables': self.n_tables, 'n_bits': self.n_bits, 'seed': self.seed}
+
+    def fit(self, vectors):
+        """Hash the rows of ``vectors`` (rows x features, sparse or dense)."""
+        vectors = sps.csr_matrix(vectors, dtype=np.float32)
+        rng = np.random.default_rng(self.seed)
+        planes = rng.standard_normal((vectors.shape[1], self.n_tables * self.n_bits)).astype(np.float32)
+        signs = np.asarray(vectors @ planes) > 0
+        weights = np.left_shift(np.int64(1), np.arange(self.n_bits, dtype=np.int64))
+        # keys_[t, i]: bucket of row i in table t
+        self.keys_ = (signs.reshape(len(signs), self.n_tables, self.n_bits) * weights).sum(axis=2).T
+        self.order_ = np.argsort(self.keys_, axis=1, kind='stable').astype(np.int32)
+        self.sorted_keys_ = np.take_along_axis(self.keys_, self.order_.astype(np.int64), axis=1)
+        return self
+
+    def candidates(self, row):
+        """Rows sharing a bucket with ``row`` in at least one table (``row`` excluded)."""
+        members = []
+        for table in range(self.n_tables):
+            key = self.keys_[table, row]
+            low, high = np.searchsorted(self.sorted_keys_[table], [key, key + 1])
+            members.append(self.order_[table, low:high])
+        members = np.unique(np.concatenate(members))
+        return members[members != row]
+
+    def neighbors(self, vectors, k=None, min_sim=1e-6):
+        """Top-``k`` cosine neighbours of every row of ``vectors`` among its candidates.
+
+        ``vectors`` are the rows the index was fitted on.  Returns a rows x
+        rows CSR matrix (int32 indices, float32 data) with every row by
+        decreasing similarity, self and similarities below ``min_sim``
+        left out, like ``recsogood.knn.item_similarities``.
+        """
+        unit = _unit_rows(vectors)
+        n_rows, n_features = unit.shape
+        row_of = np.repeat(np.arange(n_rows), np.diff(unit.indptr))
+        parts = []
+        for table in range(self.n_tables):
+            _, bucket = np.unique(self.keys_[table], return_inverse=True)
+            # every bucket gets its own copy of the feature columns, so the
+            # product only pairs rows of the same bucket
+            spread = sps.csr_matrix((unit.data, bucket[row_of].astype(np.int64) * n_features + unit.indices,
+                                     unit.indptr), shape=(n_rows, (bucket.max() + 1) * n_features))
+            rows, columns, values = _entries(spread @ spread.T)
+            keep = (rows != columns) & (values >= min_sim)
+            # the top k of the union is among the top k of every table
+            parts.append(_entries(_top_k_rows(rows[keep], columns[keep], values[keep], (n_rows, n_rows),
+                                              k, unique=False)))
+        rows, columns, values = (np.concatenate(part) for part in zip(*parts))
+        return _top_k_rows(rows, columns, values, (n_rows, n_rows), k)
+
+
+def neighbor_recall(approximate, exact, k=None):
+    """Per-row share of the exact top-``k`` neighbours found in the approximate top-``k``.
+
+    Both are neighbour matrices with rows by decreasing similarity (as
+    returned by ``RandomProjectionLSH.neighbors`` or ``item_similarities``).
+    Rows without exact neighbours are NaN.
+    """
+    approximate = _top_k_rows(*_entries(approximate), approximate.shape, k)
+    exact = _top_k_rows(*_entries(exact), exact.shape, k)
+    n_rows, n_columns = exact.shape
+    rows = np.repeat(np.arange(n_rows, dtype=np.int64), np.diff(exact.indptr))
+    found = np.isin(rows * n_columns + exact.indices,
+                    np.repeat(np.arange(n_rows, dtype=np.int64), np.diff(approximate.indptr)) * n_columns
+                    + approximate.indices)
+    hits = np.bincount(rows, weights=found, minlength=n_rows)
+    wanted = np.diff(exact.indptr)
+    return np.divide(hits, wanted, out=np.full(n_rows, np.nan), where=wanted > 0)
+
+
+def recall_report(vectors, settings=((8, 6), (16, 6), (16, 4)), k=20, min_sim=1e-6, seed=42,
+                  n_jobs=None, memory_mb=1024):
+    """Neighbour recall, time and energy of LSH settings against exact search.
+
+    ``vectors`` holds one row per user (or item); ``settings`` are
+    ``(n_tables, n_bits)`` pairs.  Returns one row for the exact search
+    (``item_similarities``) and one per setting with the mean recall@``k``,
+    the wall time, the energy and the speed-up over the exact search.
+    """
+    vectors = sps.csr_matrix(vectors, dtype=np.float32)
+    energy = EnergyRecorder()
+    with energy.measure('neighbors', method='exact'):
+        exact = item_similarities(vectors.T, k, min_sim, n_jobs, memory_mb)
+    recalls = [1.0]
+    for n_tables, n_bits in settings:
+        with energy.measure('neighbors', method='lsh', n_tables=n_tables, n_bits=n_bits):
+            index = RandomProjectionLSH(n_tables, n_bits, seed).fit(vectors)
+            approximate = index.neighbors(vectors, k, min_sim)
+        recalls.append(float(np.nanmean(neighbor_recall(approximate, exact, k))))
+    report = energy.to_frame(k=k)
+    report['recall'] = recalls
+    report['speedup'] = report['wall_s'].iloc[0] / report['wall_s']
+    columns = ['method', 'n_tables', 'n_bits', 'k', 'recall', 'wall_s', 'speedup', 'energy_j']
+    return report.reindex(columns=columns).astype({'n_tables': pd.Int64Dtype(), 'n_bits': pd.Int64Dtype()})
@@ -0,0 +1,288 @@
+"""Offline benchmark of the pipeline stages on synthetic data.
+
+Generates a dataset with ``recsogood.synthetic``, writes it in the original
+file format and times every stage of the scripts' pipeline on it: parse,
+k-core prune, per-user split, then fit, recommend and evaluate for every
+algorithm.  Each stage is measured with ``recsogood.energy`` (wall and CPU
+time, peak RSS, energy) and reported with its throughput::
+
+    python -m recsogood.benchmark --shapes ml100k ml1m --algorithms popular itemknn -o bench.csv
+
+With ``--ann 8x6 16x6`` the native k-NN algorithms are instead run exactly
+and with random-projection LSH neighbours (``recsogood.ann``) of those
+``TABLESxBITS`` settings, reporting neighbour recall, nDCG and the energy
+saved per nDCG point lost (``run_ann_tradeoff``).
+
+Nothing is downloaded.  ``popular``, ``native-itemknn`` and ``native-userknn``
+(``recsogood.knn``) need only numpy and scipy; the LensKit algorithms (configured as in the
+scripts) are run when LensKit is installed.
+"""
+import argparse
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sps
+
+from . import parallel
+from .ann import RandomProjectionLSH, neighbor_recall
+from .datasets import read_amazon_ratings, read_movielens
+from .energy import EnergyRecorder
+from .interactions import Interactions
+from .knn import ItemKNN, UserKNN
+from .metrics import ndcg_scores
+from .pruning import prune_k_core
+from .sampling import nested_portions
+from .synthetic import SHAPES, synthetic_ratings, write_amazon, write_movielens
+
+
+class MostPopular:
+    """Most rated items the user has not rated yet, in numpy only."""
+
+    def fit(self, ratings):
+        self.store = Interactions.from_frame(ratings)
+        self.counts = np.bincount(self.store.indices, minlength=self.store.n_items)
+        self.ranked = np.argsort(-self.counts, kind='stable')
+        return self
+
+    def recommend(self, user, n):
+        code = self.store.user_ids.get_loc(user)
+        seen = self.store.indices[self.store.indptr[code]:self.store.indptr[code + 1]]
+        candidates = self.ranked[:n + len(seen)]
+        top = candidates[~np.isin(candidates, seen)][:n]
+        return pd.DataFrame({'item': self.store.item_ids.take(top), 'score': self.counts[top]})
+
+
+def _lenskit(factory):
+    def build():
+        from lenskit.algorithms import Recommender
+
+        return Recommender.adapt(factory())
+    return build
+
+
+def _itemknn():
+    from lenskit.algorithms import item_knn
+
+    return item_knn.ItemItem(nnbrs=20, center=False, aggregate='sum', feedback='explicit')
+
+
+def _userknn():
+    from lenskit.algorithms import user_knn
+
+    return user_knn.UserUser(nnbrs=20, center=False, aggregate='sum', feedback='explicit')
+
+
+def _native_itemknn(ann=None):
+    return ItemKNN(nnbrs=20, center=False, aggregate='sum', feedback='explicit', ann=ann)
+
+
+def _native_userknn(ann=None):
+    return UserKNN(nnbrs=20, center=False, aggregate='sum', feedback='explicit', ann=ann)
+
+
+def _biasedmf():
+    from lenskit.algorithms.als import BiasedMF
+
+    return BiasedMF(features=50, iterations=20, reg=0.1, damping=0, bias=False, method='cd', rng_spec=42)
+
+
+def _funksvd():
+    from lenskit.algorithms.funksvd import FunkSVD
+
+    return FunkSVD(features=50, iterations=20, lrate=0.001, reg=0.015, damping=0, bias=False, random_state=42)
+
+
+def _bias():
+    from lenskit.algorithms.bias import Bias
+
+    return Bias(damping=1000)
+
+
+def _lenskit_popular():
+    from lenskit.algorithms.basic import Popular
+
+    return Popular()
+
+
+# name -> factory of an unfitted recommender with fit(ratings) and recommend(user, n)
+ALGORITHMS = {
+    'popular': MostPopular,
+    'lenskit-popular': _lenskit(_lenskit_popular),
+    'bias': _lenskit(_bias),
+    'itemknn': _lenskit(_itemknn),
+    'native-itemknn': _native_itemknn,
+    'userknn': _lenskit(_userknn),
+    'native-userknn': _native_userknn,
+    'biasedmf': _lenskit(_biasedmf),
+    'funksvd': _lenskit(_funksvd),
+}
+# algorithms whose factory takes an ``ann`` index (see run_ann_tradeoff)
+ANN_ALGORITHMS = ('native-itemknn', 'native-userknn')
+
+
+def holdout(ratings, fraction=0.1, seed=42):
+    """Per-user random test split (``round(fraction * n)`` ratings per user)."""
+    test = nested_portions(ratings['user'].to_numpy(), [fraction], seed)[fraction]
+    mask = np.zeros(len(ratings), dtype=bool)
+    mask[test] = True
+    return ratings[~mask], ratings[mask]
+
+
+def _write(shape, frame, workdir):
+    if shape.startswith('amazon'):
+        path = os.path.join(workdir, f'{shape}.json.gz')
+        write_amazon(frame, path)
+    else:
+        path = os.path.join(workdir, shape, 'ratings.dat')
+        write_movielens(frame, path)
+    return path
+
+
+def _parse(shape, path):
+    if shape.startswith('amazon'):
+        return read_amazon_ratings(path)[0]
+    return read_movielens(path)
+
+
+def run_benchmark(shapes, algorithms=('popular',), scale=1.0, core=10, n=10, n_jobs=None,
+                  seed=42, workdir=None):
+    """Benchmark every shape and algorithm; returns one row per stage."""
+    tables = []
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for shape in shapes:
+            energy = EnergyRecorder(shape=shape)
+            counts = []
+            path = _write(shape, synthetic_ratings(shape, scale, seed), tmp)
+
+            with energy.measure('parse'):
+                ratings = _parse(shape, path)
+            counts.append((len(ratings), 'interactions'))
+            # throughput of a stage is counted on its input
+            counts.append((len(ratings), 'interactions'))
+            with energy.measure('prune'):
+                ratings, _ = prune_k_core(ratings, core)
+            counts.append((len(ratings), 'interactions'))
+            with energy.measure('split'):
+                train, test = holdout(ratings, 0.1, seed)
+
+            users = test['user'].unique()
+            for name in algorithms:
+                model = ALGORITHMS[name]()
+                with energy.measure('fit', algorithm=name):
+                    model.fit(train)
+                counts.append((len(train), 'interactions'))
+                with energy.measure('recommend', algorithm=name):
+                    recs = parallel.recommend(model, users, n, n_jobs)
+                counts.append((len(users), 'users'))
+                with energy.measure('evaluate', algorithm=name):
+                    ndcg_scores(recs, test, n)
+                counts.append((len(users), 'users'))
+                del model, recs
+
+            table = energy.to_frame()
+            table['count'] = [count for count, _ in counts]
+            table['unit'] = [unit for _, unit in counts]
+            table['per_s'] = table['count'] / table['wall_s']
+            tables.append(table)
+    columns = ['shape', 'algorithm', 'stage', 'count', 'unit', 'per_s', 'wall_s', 'cpu_s',
+               'peak_rss_mb', 'children_rss_mb', 'energy_j', 'energy_source']
+    table = pd.concat(tables, ignore_index=True).reindex(columns=columns)
+    return table.fillna({'algorithm': ''})
+
+
+def _neighbor_rows(model, users, k):
+    # the neighbour lists a fitted native k-NN model scores with: every
+    # item's for ItemKNN, the evaluated users' for UserKNN
+    if isinstance(model, ItemKNN):
+        return model.sim_matrix_
+    codes = model.user_ids_.get_indexer(users)
+    lists = [model._neighbors(code)[0][:k] for code in codes]
+    indptr = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum([len(found) for found in lists], out=indptr[1:])
+    indices = np.concatenate(lists) if lists else np.empty(0, dtype=np.int64)
+    # rows in order of decreasing similarity; the values only have to rank them
+    data = np.concatenate([np.arange(len(found), 0, -1) for found in lists]) if lists else np.empty(0)
+    return sps.csr_matrix((data.astype(np.float32), indices, indptr), shape=(len(lists), len(model.user_ids_)))
+
+
+def run_ann_tradeoff(shapes, algorithms=ANN_ALGORITHMS, settings=((8, 6), (16, 6), (16, 4)), scale=1.0,
+                     core=10, n=10, n_jobs=None, seed=42):
+    """Energy saved per nDCG point lost by approximate neighbours.
+
+    Fits and evaluates every algorithm of ``ANN_ALGORITHMS`` exactly and
+    with a ``RandomProjectionLSH`` of every ``(n_tables, n_bits)`` setting.
+    Returns one row per run with its neighbour recall@nnbrs against the
+    exact model, nDCG, the wall time and energy of fit plus recommend,
+    and, relative to the exact run, the energy saved, the nDCG points lost
+    and the joules saved per point lost.
+    """
+    rows = []
+    for shape in shapes:
+        ratings, _ = prune_k_core(synthetic_ratings(shape, scale, seed), core)
+        train, test = holdout(ratings, 0.1, seed)
+        users = test['user'].unique()
+        for name in algorithms:
+            exact = None
+            for setting in (None,) + tuple(settings):
+                ann = None if setting is None else RandomProjectionLSH(*setting, seed=seed)
+                model = ALGORITHMS[name](ann)
+                energy = EnergyRecorder()
+                with energy.measure('fit'):
+                    model.fit(train)
+                with energy.measure('recommend'):
+                    recs = parallel.recommend(model, users, n, n_jobs)
+                neighbors = _neighbor_rows(model, users, model.nnbrs)
+                if exact is None:
+                    exact = neighbors
+                cost = energy.to_frame()[['wall_s', 'energy_j']].sum()
+                rows.append({'shape': shape, 'algorithm': name, 'method': 'exact' if ann is None else 'lsh',
+                             'n_tables': setting and setting[0], 'n_bits': setting and setting[1],
+                             'recall': float(np.nanmean(neighbor_recall(neighbors, exact, model.nnbrs))),
+                             'ndcg': ndcg_scores(recs, test, n)[1],
+                             'wall_s': cost['wall_s'], 'energy_j': cost['energy_j']})
+                del model, recs
+
+    table = pd.DataFrame(rows).astype({'n_tables': pd.Int64Dtype(), 'n_bits': pd.Int64Dtype()})
+    baseline = table[table['method'] == 'exact'].set_index(['shape', 'algorithm'])
+    keys = pd.MultiIndex.from_frame(table[['shape', 'algorithm']])
+    table['energy_saved_j'] = baseline['energy_j'].reindex(keys).to_numpy() - table['energy_j']
+    table['ndcg_lost_points'] = 100 * (baseline['ndcg'].reindex(keys).to_numpy() - table['ndcg'])
+    lost = table['ndcg_lost_points'].to_numpy()
+    table['saved_j_per_point'] = np.divide(table['energy_saved_j'].to_numpy(), lost,
+                                           out=np.full(len(table), np.nan), where=lost > 0)
+    return table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shapes', nargs='+', default=['ml100k'], choices=sorted(SHAPES))
+    parser.add_argument('--algorithms', nargs='+', default=['popular'], choices=sorted(ALGORITHMS))
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply users and interactions')
+    parser.add_argument('--core', type=int, default=10)
+    parser.add_argument('-n', type=int, default=10, help='recommendation list length')
+    parser.add_argument('--jobs', type=int, help='recommendation workers (default: RECSOGOOD_JOBS or all CPUs)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workdir', help='directory for the generated files (default: system temp)')
+    parser.add_argument('--ann', nargs='+', metavar='TABLESxBITS',
+                        help='instead of the stage benchmark, compare exact and LSH neighbours of the '
+                             'native k-NN algorithms for these settings, e.g. --ann 8x6 16x6')
+    parser.add_argument('-o', '--output', help='write the table to this CSV file')
+    args = parser.parse_args(argv)
+
+    if args.ann:
+        settings = [tuple(int(part) for part in setting.lower().split('x')) for setting in args.ann]
+        algorithms = [name for name in args.algorithms if name in ANN_ALGORITHMS] or ANN_ALGORITHMS
+        table = run_ann_tradeoff(args.shapes, algorithms, settings, args.scale, args.core, args.n,
+                                 args.jobs, args.seed)
+    else:
+        table = run_benchmark(args.shapes, args.algorithms, args.scale, args.core, args.n, args.jobs,
+                              args.seed, args.workdir)
+    print(table.to_string(index=False))
+    if args.output:
+        table.to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
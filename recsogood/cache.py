@@ -0,0 +1,183 @@
+"""On-disk caches for tables and pipeline stages.
+
+A cached frame is a directory with one ``.npy`` file per column and a
+``meta.json`` describing the columns, so it loads with ``np.load`` (memory
+mapped by default) instead of re-parsing text.  Entries are keyed by a hash
+of the source file (path, size, modification time) and the options used to
+build the table, e.g. the cleaning steps and the k-core threshold.
+
+``StageCache`` memoizes arbitrary stage results (splits, fitted models,
+recommendation lists, metrics) as pickles keyed by content hashes, with a
+size limit enforced by least-recently-used eviction.
+"""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+_META = 'meta.json'
+
+
+def fingerprint(source, **options):
+    """Hash ``source`` (file metadata) together with the build ``options``."""
+    stat = os.stat(source)
+    payload = {
+        'source': os.path.abspath(source),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'options': options,
+    }
+    blob = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.sha256(blob).hexdigest()[:24]
+
+
+def save_frame(frame, directory):
+    """Write ``frame`` to ``directory`` as one ``.npy`` file per column.
+
+    The directory is written under a temporary name and moved into place, so
+    an interrupted run never leaves a half-written entry behind.
+    """
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    try:
+        columns = []
+        for i, name in enumerate(frame.columns):
+            values = frame[name].to_numpy()
+            if values.dtype == object:
+                values = values.astype(str)
+            np.save(os.path.join(tmp, f'{i}.npy'), values, allow_pickle=False)
+            columns.append(str(name))
+        meta = {'columns': columns, 'rows': len(frame)}
+        if not frame.index.equals(pd.RangeIndex(len(frame))):
+            np.save(os.path.join(tmp, 'index.npy'), frame.index.to_numpy(), allow_pickle=False)
+            meta['index'] = frame.index.name
+        with open(os.path.join(tmp, _META), 'w') as f:
+            json.dump(meta, f)
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+        os.replace(tmp, directory)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def load_frame(directory, mmap=True):
+    """Load a frame written by ``save_frame``; columns are memory mapped."""
+    with open(os.path.join(directory, _META)) as f:
+        meta = json.load(f)
+    mode = 'r' if mmap else None
+    data = {name: np.load(os.path.join(directory, f'{i}.npy'), mmap_mode=mode)
+            for i, name in enumerate(meta['columns'])}
+    index = None
+    if 'index' in meta:
+        index = pd.Index(np.load(os.path.join(directory, 'index.npy'), mmap_mode=mode),
+                         name=meta['index'])
+    return pd.DataFrame(data, index=index, copy=False)
+
+
+def cached_frame(source, build, cache_dir=None, **options):
+    """Return the table built from ``source``, using the cache when possible.
+
+    ``build()`` is only called on a cache miss; its result is stored under
+    ``cache_dir`` (default: ``.recsogood_cache`` next to ``source``) in a
+    directory named after ``fingerprint(source, **options)``.  Pass every
+    option that changes the result (cleaning steps, core threshold, ...).
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(source)), '.recsogood_cache')
+    entry = os.path.join(cache_dir, fingerprint(source, **options))
+    if os.path.exists(os.path.join(entry, _META)):
+        return load_frame(entry)
+    frame = build()
+    save_frame(frame, entry)
+    return frame
+
+
+def content_hash(*parts):
+    """Stable hash of JSON-like values, arrays and frames."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (pd.DataFrame, pd.Series)):
+            digest.update(pd.util.hash_pandas_object(part, index=True).to_numpy().tobytes())
+            names = part.columns if isinstance(part, pd.DataFrame) else [part.name]
+            digest.update(json.dumps([str(c) for c in names]).encode())
+        elif isinstance(part, np.ndarray):
+            digest.update(str(part.dtype).encode())
+            digest.update(np.ascontiguousarray(part).tobytes())
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode())
+        digest.update(b'\0')
+    return digest.hexdigest()[:32]
+
+
+class StageCache:
+    """Pickle store for stage results with a size limit and LRU eviction.
+
+    Every read of an entry refreshes its modification time; when a write
+    takes the store over ``max_bytes``, the least recently used entries are
+    deleted until it fits again.
+    """
+
+    def __init__(self, directory, max_bytes=10 * 2 ** 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.pkl')
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        """Return the stored value; raises ``KeyError`` when missing."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            raise KeyError(key) from None
+        os.utime(path)
+        return value
+
+    def put(self, key, value):
+        """Store ``value`` under ``key`` (atomically), then evict if needed."""
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        self.evict()
+
+    def memoize(self, key, fn, *args):
+        """Return the cached value of ``key``, computing ``fn(*args)`` on a miss."""
+        try:
+            return self.get(key)
+        except KeyError:
+            value = fn(*args)
+            self.put(key, value)
+            return value
+
+    def evict(self):
+        """Delete least recently used entries until the store fits ``max_bytes``."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pkl'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime_ns, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.unlink(os.path.join(self.directory, name))
+            total -= size
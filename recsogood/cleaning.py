@@ -0,0 +1,95 @@
+"""Single-pass cleaning of rating frames.
+
+The scripts cleaned ratings with ``dropna``, ``drop_duplicates`` and a
+``groupby([user, item]).mean()``, and called ``duplicated`` before and after
+to print diagnostics, each step building a new frame or hash table.
+``clean_interactions`` does the same work from one sort of the rows by
+(user, item, rating) on integer keys and reports the counts it finds on the
+way.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _sort_keys(values):
+    # non-negative int64 codes in the sort order of ``values``, and their range
+    if values.dtype.kind in 'iu' and len(values):
+        low = int(values.min())
+        return values.astype(np.int64) - low, int(values.max()) - low + 1
+    codes, uniques = pd.factorize(values, sort=True)
+    return codes.astype(np.int64), len(uniques)
+
+
+def _complete_rows(frame, user_col, item_col, rating_col):
+    # the three columns as arrays without the rows missing any of them,
+    # and the number of missing cells
+    users = frame[user_col].to_numpy()
+    items = frame[item_col].to_numpy()
+    ratings = frame[rating_col].to_numpy()
+    missing = pd.isna(ratings)
+    for values in (users, items):
+        if values.dtype.kind not in 'iub':
+            missing |= pd.isna(values)
+    empty_cells = int(sum(pd.isna(v).sum() for v in (users, items, ratings)))
+    if missing.any():
+        keep = ~missing
+        users, items, ratings = users[keep], items[keep], ratings[keep]
+    return users, items, ratings, empty_cells
+
+
+def _sort_rows(user_keys, item_keys, n_items, ratings):
+    # row order by (user, item, rating) and, in that order, where a
+    # (user, item) run starts and where a distinct row starts
+    if len(user_keys) and int(user_keys.max()) + 1 > np.iinfo(np.int64).max // max(n_items, 1):
+        raise ValueError("too many users and items to combine into one key")
+    keys = user_keys * n_items + item_keys
+    order = np.lexsort((ratings, keys))
+    keys = keys[order]
+    sorted_ratings = ratings[order]
+    pair_start = np.ones(len(keys), dtype=bool)
+    pair_start[1:] = keys[1:] != keys[:-1]
+    row_start = pair_start.copy()
+    row_start[1:] |= sorted_ratings[1:] != sorted_ratings[:-1]
+    return order, pair_start, row_start
+
+
+def clean_interactions(frame, user_col='user', item_col='item', rating_col='rating'):
+    """Drop incomplete rows, remove duplicates and average repeated ratings.
+
+    Gives the same frame as::
+
+        frame.dropna(subset=[user_col, item_col, rating_col])[[user_col, item_col, rating_col]]
+             .drop_duplicates()
+             .groupby([user_col, item_col], as_index=False)[rating_col].mean()
+
+    i.e. rows sorted by user and item, one row per pair holding the mean of
+    its distinct ratings, with the rating dtype kept.  Other columns are
+    dropped.  Also returns a dict with the diagnostic counts of the input:
+    ``rows``, ``empty_cells`` (missing values in the three columns),
+    ``duplicate_rows`` (repeated (user, item, rating) rows among the
+    complete ones), ``duplicate_ratings`` (repeated (user, item) pairs) and
+    ``rows_after``.
+    """
+    users, items, ratings, empty_cells = _complete_rows(frame, user_col, item_col, rating_col)
+    stats = {'rows': len(frame), 'empty_cells': empty_cells}
+    user_keys, _ = _sort_keys(users)
+    item_keys, n_items = _sort_keys(items)
+    order, pair_start, row_start = _sort_rows(user_keys, item_keys, n_items, ratings)
+    stats['duplicate_rows'] = int(len(order) - row_start.sum())
+    stats['duplicate_ratings'] = int(len(order) - pair_start.sum())
+    sorted_ratings = ratings[order]
+
+    distinct = np.flatnonzero(row_start)
+    distinct_pair = pair_start[distinct]
+    starts = np.flatnonzero(distinct_pair)
+    sums = np.add.reduceat(sorted_ratings[distinct].astype(np.float64), starts) if len(starts) else np.empty(0)
+    counts = np.diff(np.append(starts, len(distinct)))
+    firsts = order[distinct[starts]]
+
+    cleaned = pd.DataFrame({
+        user_col: users[firsts],
+        item_col: items[firsts],
+        rating_col: (sums / counts).astype(ratings.dtype),
+    })
+    stats['rows_after'] = len(cleaned)
+    return cleaned, stats
@@ -0,0 +1,196 @@
+"""Time, memory and energy measurement of pipeline stages.
+
+``EnergyRecorder.measure`` wraps a stage (fit, recommend, evaluate, ...) and
+records one row with its wall time, CPU time, peak resident memory and
+energy.  Energy is read from the Linux RAPL counters in
+``/sys/class/powercap`` when they are readable (CPU packages, plus DRAM where
+exposed); otherwise it is estimated as CPU time x the per-core share of the
+processor's TDP (``tdp_watts``, default ``RECSOGOOD_TDP_WATTS`` or 65 W).
+The ``energy_source`` column says which one was used.
+
+CPU time includes worker processes (e.g. ``recsogood.parallel``) once they
+have exited.  ``peak_rss_mb`` is the peak memory of the main process, reset
+at the start of every stage where Linux allows it.  ``children_rss_mb`` is
+the peak total memory of the live worker processes during the stage, sampled
+from ``/proc`` on a background thread (proportional set size, so pages a
+forked worker shares with the parent are not counted once per worker); it is
+NaN where ``/proc`` is not available.
+"""
+import glob
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+_POWERCAP = '/sys/class/powercap'
+
+
+def rapl_domains():
+    """Readable top-level RAPL zones as ``(name, energy file, wrap range)``.
+
+    Sub-zones (cores, uncore) are skipped since the package zone already
+    includes them; the DRAM zone of server parts is a top-level zone or a
+    ``dram`` sub-zone and is kept.
+    """
+    domains = []
+    for zone in sorted(glob.glob(os.path.join(_POWERCAP, 'intel-rapl:*'))):
+        try:
+            with open(os.path.join(zone, 'name')) as f:
+                name = f.read().strip()
+            if zone.count(':') > 1 and name != 'dram':
+                continue
+            energy = os.path.join(zone, 'energy_uj')
+            with open(energy) as f:
+                int(f.read())
+            with open(os.path.join(zone, 'max_energy_range_uj')) as f:
+                wrap = int(f.read())
+        except (OSError, ValueError):
+            continue
+        domains.append((f'{os.path.basename(zone)}:{name}', energy, wrap))
+    return domains
+
+
+def _read_counters(domains):
+    counters = []
+    for _, path, _ in domains:
+        with open(path) as f:
+            counters.append(int(f.read()))
+    return counters
+
+
+def _reset_peak_rss():
+    # writing 5 to clear_refs resets VmHWM (Linux >= 4.0)
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _child_pids():
+    pids = set()
+    for path in glob.glob(f'/proc/{os.getpid()}/task/*/children'):
+        try:
+            with open(path) as f:
+                pids.update(int(pid) for pid in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def _process_mb(pid):
+    for name, key in (('smaps_rollup', 'Pss:'), ('status', 'VmRSS:')):
+        try:
+            with open(f'/proc/{pid}/{name}') as f:
+                for line in f:
+                    if line.startswith(key):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            continue
+    return 0.0
+
+
+class _ChildSampler(threading.Thread):
+    """Peak total memory of the live child processes, sampled every ``interval`` seconds."""
+
+    def __init__(self, interval=0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.available = os.path.isdir(f'/proc/{os.getpid()}/task')
+        self.peak = 0.0
+        self._done = threading.Event()
+
+    def run(self):
+        while self.available:
+            self.peak = max(self.peak, sum(_process_mb(pid) for pid in _child_pids()))
+            if self._done.wait(self.interval):
+                return
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return self.peak if self.available else float('nan')
+
+
+def _cpu_seconds():
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+class EnergyRecorder:
+    """Collect per-stage measurements labelled with e.g. dataset, algorithm, portion.
+
+    Example::
+
+        energy = EnergyRecorder(dataset='ml-1m', algorithm='ItemItem', portion=0.5)
+        with energy.measure('fit'):
+            model.fit(train)
+        energy.to_frame(ndcg=mean_ndcg)
+    """
+
+    def __init__(self, tdp_watts=None, **labels):
+        if tdp_watts is None:
+            tdp_watts = float(os.environ.get('RECSOGOOD_TDP_WATTS', 65.0))
+        self.tdp_watts = tdp_watts
+        self.labels = labels
+        self.domains = rapl_domains()
+        self.rows = []
+
+    @contextmanager
+    def measure(self, stage, **labels):
+        """Measure the enclosed block and append a row for ``stage``.
+
+        Yields the row's labels, which the block may extend.
+        """
+        labels = dict(labels)
+        _reset_peak_rss()
+        children = _ChildSampler()
+        children.start()
+        counters = _read_counters(self.domains)
+        cpu = _cpu_seconds()
+        wall = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = _cpu_seconds() - cpu
+            children = children.stop()
+            if self.domains:
+                end = _read_counters(self.domains)
+                energy = sum((e - s) % wrap for s, e, (_, _, wrap) in zip(counters, end, self.domains)) / 1e6
+                source = 'rapl'
+            else:
+                energy = cpu * self.tdp_watts / (os.cpu_count() or 1)
+                source = 'estimate'
+            self.rows.append({**self.labels, **labels, 'stage': stage, 'wall_s': wall, 'cpu_s': cpu,
+                              'peak_rss_mb': _peak_rss_mb(), 'children_rss_mb': children, 'energy_j': energy,
+                              'energy_source': source})
+
+    def to_frame(self, **columns):
+        """One row per measured stage; ``columns`` are added as constant columns."""
+        return pd.DataFrame(self.rows).assign(**columns)
+
+    def append_csv(self, path, **columns):
+        """Append the rows to a CSV file (header written when it is created)."""
+        frame = self.to_frame(**columns)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        frame.to_csv(path, mode='a', index=False, header=not os.path.exists(path))
+        return frame
@@ -0,0 +1,138 @@
+"""Canonical CSR interaction store shared by the LensKit and RecPack paths.
+
+An ``Interactions`` object is built once per dataset (and portion) and holds
+the user x item ratings as CSR arrays (int32 item codes, float32 ratings)
+together with the user and item id maps.  It can be viewed as a LensKit-style
+rating frame or as a RecPack ``InteractionMatrix`` over the same codes,
+without factorizing the ids again.  The runner builds one per dataset
+after pruning and the RecPack scripts build their ``InteractionMatrix``
+through it.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sps
+
+
+class Interactions:
+    """User x item ratings in CSR layout.
+
+    Attributes:
+        indptr: int64 row pointers, one row per user code.
+        indices: int32 item codes of each interaction.
+        data: float32 ratings of each interaction.
+        user_ids: ``Index`` mapping user codes to the original user ids.
+        item_ids: ``Index`` mapping item codes to the original item ids.
+    """
+
+    def __init__(self, indptr, indices, data, user_ids, item_ids):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.user_ids = user_ids
+        self.item_ids = item_ids
+        self._csc = None
+        self._user_codes = None
+
+    @classmethod
+    def from_frame(cls, frame, user_col='user', item_col='item', rating_col='rating'):
+        """Build the store from a rating frame (ids are sorted before coding)."""
+        user_codes, user_ids = pd.factorize(frame[user_col], sort=True)
+        item_codes, item_ids = pd.factorize(frame[item_col], sort=True)
+        order = np.argsort(user_codes, kind='stable')
+
+        indptr = np.zeros(len(user_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(user_codes, minlength=len(user_ids)), out=indptr[1:])
+        indices = item_codes[order].astype(np.int32)
+        if rating_col in frame:
+            data = frame[rating_col].to_numpy(dtype=np.float32)[order]
+        else:
+            data = np.ones(len(indices), dtype=np.float32)
+        return cls(indptr, indices, data, pd.Index(user_ids), pd.Index(item_ids))
+
+    @property
+    def n_users(self):
+        return len(self.user_ids)
+
+    @property
+    def n_items(self):
+        return len(self.item_ids)
+
+    @property
+    def nnz(self):
+        return len(self.indices)
+
+    @property
+    def user_codes(self):
+        """User code of every interaction (expanded from ``indptr`` on first use and kept)."""
+        if self._user_codes is None:
+            self._user_codes = np.repeat(np.arange(self.n_users, dtype=np.int32), np.diff(self.indptr))
+        return self._user_codes
+
+    @property
+    def csr(self):
+        """``scipy.sparse.csr_matrix`` sharing the store's arrays."""
+        return sps.csr_matrix((self.data, self.indices, self.indptr),
+                              shape=(self.n_users, self.n_items), copy=False)
+
+    @property
+    def csc(self):
+        """Item-major copy, built on first use and kept."""
+        if self._csc is None:
+            self._csc = self.csr.tocsc()
+        return self._csc
+
+    def take(self, positions):
+        """Keep the interactions at ``positions`` (sorted), with the same id maps."""
+        positions = np.asarray(positions)
+        counts = np.bincount(self.user_codes[positions], minlength=self.n_users)
+        indptr = np.zeros(self.n_users + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return Interactions(indptr, self.indices[positions], self.data[positions],
+                            self.user_ids, self.item_ids)
+
+    def to_frame(self, codes=False, user_col='user', item_col='item', rating_col='rating'):
+        """LensKit-style rating frame.
+
+        With ``codes=True`` the user and item columns hold the integer codes;
+        the item and rating columns are then views of the CSR arrays.
+        """
+        users = self.user_codes
+        items = self.indices
+        if not codes:
+            users = self.user_ids.take(users)
+            items = self.item_ids.take(items)
+        return pd.DataFrame({user_col: users, item_col: items, rating_col: self.data}, copy=False)
+
+    def to_recpack(self):
+        """RecPack ``InteractionMatrix`` over the same user and item codes.
+
+        Built with RecPack's public constructor from the kept ``user_codes``
+        and ``indices``, so no ids are factorized again; the constructor
+        copies the two code columns.
+        """
+        from recpack.matrix import InteractionMatrix
+
+        frame = pd.DataFrame({'user': self.user_codes, 'item': self.indices}, copy=False)
+        return InteractionMatrix(frame, 'item', 'user', shape=(self.n_users, self.n_items))
+
+    def save(self, directory):
+        """Write the arrays and id maps as ``.npy`` files."""
+        os.makedirs(directory, exist_ok=True)
+        for name in ('indptr', 'indices', 'data'):
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+        for name in ('user_ids', 'item_ids'):
+            ids = getattr(self, name).to_numpy()
+            if ids.dtype == object:
+                ids = ids.astype(str)
+            np.save(os.path.join(directory, f'{name}.npy'), ids, allow_pickle=False)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Load a store written by ``save``; arrays are memory mapped."""
+        mode = 'r' if mmap else None
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mode)
+                  for name in ('indptr', 'indices', 'data', 'user_ids', 'item_ids')}
+        return cls(arrays['indptr'], arrays['indices'], arrays['data'],
+                   pd.Index(arrays['user_ids']), pd.Index(arrays['item_ids']))
@@ -0,0 +1,560 @@
+"""Item-based k-NN with blocked similarity computation.
+
+``ItemKNN`` reproduces LensKit's ``item_knn.ItemItem`` for explicit
+feedback -- cosine similarity of the (optionally item-centred) rating
+columns, similarities below ``min_sim`` dropped, at scoring time the
+``nnbrs`` most similar items among those the user rated, aggregated with
+``'sum'`` (sum of the similarities) or ``'weighted-average'`` -- without
+LensKit's single-threaded full similarity matrix.  The similarities are
+computed as sparse products of blocks of item rows against the CSR rating
+matrix on a thread pool, each block is reduced to its top neighbours with
+``argpartition`` before the next one is started, and the result is kept as a
+CSR neighbour table with int32 item codes and float32 similarities.  The
+block size follows ``memory_mb``, so the temporary dense blocks of all
+threads stay within that budget.
+
+The model has ``fit(ratings)`` and ``recommend(user, n)`` like a LensKit
+``Recommender``, so it works with ``recsogood.parallel``, ``neighbor_sweep``
+and ``save_model``.
+"""
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sps
+from numpy.lib.format import open_memmap
+
+from .cache import content_hash
+from .interactions import Interactions
+from .parallel import default_jobs
+
+_META = 'meta.json'
+
+# bytes per similarity cell while a block is reduced to its top-k: the sparse
+# product (value + column index), its dense copy, the negated copy and the
+# argpartition indices; keeping all neighbours sorts the whole block (twice that)
+_CELL_BYTES = 32
+# similarity cells per dense block when scoring one user
+_SCORE_CELLS = 2 ** 22
+# neighbour ratings ranked at once by UserKNN; small, so items that already
+# have their neighbours are dropped early
+_RANK_CELLS = 2 ** 16
+
+
+def block_size(n_items, n_jobs=1, memory_mb=1024, cell_bytes=_CELL_BYTES):
+    """Item rows per block so ``n_jobs`` blocks in flight fit in ``memory_mb``."""
+    budget = memory_mb * 2 ** 20 // max(n_jobs, 1)
+    return int(max(1, min(n_items, budget // (cell_bytes * max(n_items, 1)))))
+
+
+def _ranges(starts, lengths):
+    # concatenation of range(start, start + length) for every pair
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return np.arange(lengths.sum(), dtype=np.int64) + offsets
+
+
+def top_neighbors(block, first, k=None, min_sim=1e-6):
+    """Reduce a dense similarity block to per-row neighbour lists.
+
+    ``block`` holds the similarities of rows ``first, first + 1, ...`` with
+    every column (it is modified in place).  Keeps, per row, the ``k``
+    largest similarities of at least ``min_sim`` (all of them when ``k`` is
+    None), self-similarity excluded.  Returns ``(counts, indices, data)``:
+    the neighbour count per row and the int32 columns and float32
+    similarities, row by row in descending order.
+    """
+    rows = np.arange(len(block))
+    block[rows, first + rows] = -np.inf
+    if k is not None and k < block.shape[1]:
+        columns = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        values = np.take_along_axis(block, columns, axis=1)
+    else:
+        columns = np.broadcast_to(np.arange(block.shape[1]), block.shape)
+        values = block
+    values = np.where(values >= min_sim, values, -np.inf)
+    order = np.argsort(-values, axis=1, kind='stable')
+    values = np.take_along_axis(values, order, axis=1)
+    columns = np.take_along_axis(columns, order, axis=1)
+    keep = values > -np.inf
+    return keep.sum(axis=1), columns[keep].astype(np.int32), values[keep].astype(np.float32)
+
+
+def _stack(parts, n_rows, n_columns):
+    counts, indices, data = zip(*parts)
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.concatenate(counts), out=indptr[1:])
+    return sps.csr_matrix((np.concatenate(data), np.concatenate(indices), indptr),
+                          shape=(n_rows, n_columns))
+
+
+def _map_blocks(matrix, reduce, n_jobs=None, memory_mb=1024, cell_bytes=_CELL_BYTES):
+    # cosine similarities of blocks of item rows with every item, each passed
+    # as ``reduce(first, block)`` on a thread pool; returns the results in order
+    matrix = sps.csr_matrix(matrix, dtype=np.float32)
+    n_items = matrix.shape[1]
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    normalized = sps.csr_matrix(matrix @ sps.diags(scale.astype(np.float32)))
+    item_rows = normalized.T.tocsr()
+    if n_jobs is None:
+        n_jobs = default_jobs()
+    step = block_size(n_items, n_jobs, memory_mb, cell_bytes)
+
+    def run(first):
+        return reduce(first, (item_rows[first:first + step] @ normalized).toarray())
+
+    # scipy's sparse products and numpy's partitioning release the GIL
+    with ThreadPoolExecutor(max(1, n_jobs)) as pool:
+        return list(pool.map(run, range(0, n_items, step)))
+
+
+def item_similarities(matrix, k=None, min_sim=1e-6, n_jobs=None, memory_mb=1024):
+    """Top-``k`` cosine neighbours of every column of a user x item matrix.
+
+    Returns an item x item CSR matrix (int32 indices, float32 data) whose
+    row ``i`` holds the neighbours of item ``i`` by decreasing similarity.
+    Blocks of item rows are multiplied with the column-normalized matrix and
+    reduced on ``n_jobs`` threads (default ``RECSOGOOD_JOBS`` or all CPUs);
+    ``memory_mb`` bounds the temporary blocks of all threads together.
+    """
+    n_items = matrix.shape[1]
+    parts = _map_blocks(matrix, lambda first, block: top_neighbors(block, first, k, min_sim),
+                        n_jobs, memory_mb, _CELL_BYTES if k else 2 * _CELL_BYTES)
+    if not parts:
+        return sps.csr_matrix((n_items, n_items), dtype=np.float32)
+    return _stack(parts, n_items, n_items)
+
+
+def _top_k_columns(block, first, k, min_sim):
+    # exactly ``k`` columns per row by decreasing similarity; self-similarity
+    # and similarities below ``min_sim`` become zeros
+    rows = np.arange(len(block))
+    block[rows, first + rows] = 0
+    block[block < min_sim] = 0
+    if k < block.shape[1]:
+        columns = np.argpartition(-block, k - 1, axis=1)[:, :k]
+    else:
+        columns = np.broadcast_to(np.arange(block.shape[1]), block.shape)
+    values = np.take_along_axis(block, columns, axis=1)
+    order = np.argsort(-values, axis=1, kind='stable')
+    return np.take_along_axis(columns, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+
+def _spill_neighbors(matrix, directory, k, min_sim, n_jobs, memory_mb):
+    # reduce the blocks straight into memory-mapped items x k arrays; the maps
+    # are flushed, and closed when they go out of scope on return
+    n_items = matrix.shape[1]
+    indices = open_memmap(os.path.join(directory, 'indices.npy'), 'w+', np.int32, (n_items, k))
+    data = open_memmap(os.path.join(directory, 'data.npy'), 'w+', np.float32, (n_items, k))
+
+    def spill(first, block):
+        columns, values = _top_k_columns(block, first, k, min_sim)
+        indices[first:first + len(block)] = columns
+        data[first:first + len(block)] = values
+
+    _map_blocks(matrix, spill, n_jobs, memory_mb)
+    indices.flush()
+    data.flush()
+
+
+def write_neighbors(matrix, directory, k, min_sim=0.0, n_jobs=None, memory_mb=1024):
+    """Write the top-``k`` cosine neighbours of every item to ``directory``.
+
+    The neighbour file holds ``indices.npy`` (int32) and ``data.npy``
+    (float32), both ``items x k`` with every row sorted by decreasing
+    similarity and padded with zero similarities, plus ``meta.json``.  Each
+    block is written to the memory-mapped arrays as soon as it is reduced,
+    so neither the similarity matrix nor the neighbour table is ever held in
+    memory; ``memory_mb`` bounds the blocks in flight.
+
+    The file is keyed by a hash of ``matrix`` and ``min_sim``: when
+    ``directory`` already holds neighbours of the same data for at least
+    ``k`` items per row, nothing is computed.  Returns ``load_neighbors``
+    of the file, limited to ``k`` columns.
+    """
+    matrix = sps.csr_matrix(matrix, dtype=np.float32)
+    n_items = matrix.shape[1]
+    k = min(k, n_items)
+    key = content_hash(matrix.indptr, matrix.indices, matrix.data, matrix.shape, min_sim)
+    try:
+        with open(os.path.join(directory, _META)) as f:
+            meta = json.load(f)
+        if meta['key'] == key and meta['k'] >= k:
+            return load_neighbors(directory, k)
+    except (OSError, ValueError, KeyError):
+        pass
+
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    try:
+        _spill_neighbors(matrix, tmp, k, min_sim, n_jobs, memory_mb)
+        with open(os.path.join(tmp, _META), 'w') as f:
+            json.dump({'items': n_items, 'k': k, 'min_sim': min_sim, 'key': key}, f)
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.replace(tmp, directory)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return load_neighbors(directory, k)
+
+
+def load_neighbors(directory, k=None, mmap_mode='c'):
+    """Item x item CSR matrix over a neighbour file written by ``write_neighbors``.
+
+    The arrays are memory mapped (copy-on-write by default).  With ``k``
+    smaller than the stored width, the first ``k`` neighbours of every row
+    are copied into memory instead.
+    """
+    indices = np.load(os.path.join(directory, 'indices.npy'), mmap_mode=mmap_mode)
+    data = np.load(os.path.join(directory, 'data.npy'), mmap_mode=mmap_mode)
+    n_items, width = indices.shape
+    if k is not None and k < width:
+        indices, data, width = np.ascontiguousarray(indices[:, :k]), np.ascontiguousarray(data[:, :k]), k
+    indptr = np.arange(n_items + 1, dtype=np.int64) * width
+    return sps.csr_matrix((data.reshape(-1), indices.reshape(-1), indptr),
+                          shape=(n_items, n_items), copy=False)
+
+
+class _NeighborRecommender:
+    # predict_for_user and recommend around ``self._scores(code)``, which
+    # returns the scores of every item (NaN when unscored) and the user's items
+
+    def predict_for_user(self, user, items, ratings=None):
+        """Scores of ``items`` for ``user`` as a Series (NaN when not scorable)."""
+        items = pd.Index(items)
+        if user not in self.user_ids_:
+            return pd.Series(np.nan, index=items)
+        scores, _ = self._scores(self.user_ids_.get_loc(user))
+        codes = self.item_ids_.get_indexer(items)
+        result = np.full(len(items), np.nan)
+        result[codes >= 0] = scores[codes[codes >= 0]]
+        return pd.Series(result, index=items)
+
+    def recommend(self, user, n=None, candidates=None, ratings=None):
+        """Top-``n`` unrated (or ``candidates``) items for ``user``: item and score columns."""
+        if user not in self.user_ids_:
+            return pd.DataFrame({'item': self.item_ids_[:0], 'score': np.empty(0)})
+        scores, rated = self._scores(self.user_ids_.get_loc(user))
+        if candidates is None:
+            scores[rated] = np.nan
+        else:
+            wanted = self.item_ids_.get_indexer(candidates)
+            mask = np.ones(len(scores), dtype=bool)
+            mask[wanted[wanted >= 0]] = False
+            scores[mask] = np.nan
+        codes = np.flatnonzero(~np.isnan(scores))
+        if n is not None and n < len(codes):
+            codes = codes[np.argpartition(-scores[codes], n - 1)[:n]]
+        codes = codes[np.argsort(-scores[codes], kind='stable')]
+        return pd.DataFrame({'item': self.item_ids_.take(codes), 'score': scores[codes]})
+
+
+class ItemKNN(_NeighborRecommender):
+    """Item-item k-NN with the parameters of LensKit's ``ItemItem``.
+
+    ``save_nbrs`` caps the neighbours stored per item (LensKit's parameter
+    of the same name; None keeps all above ``min_sim``), ``nnbrs`` is
+    applied at scoring time and can be changed after fitting.  ``n_jobs``
+    and ``memory_mb`` control the fit (see ``item_similarities``).  With
+    ``neighbor_dir`` (requires ``save_nbrs``) the neighbour table is written
+    there by ``write_neighbors`` and memory mapped instead of kept in memory.
+    With ``ann`` (e.g. ``recsogood.ann.RandomProjectionLSH()``) the
+    neighbours are searched among the items sharing a hash bucket only.
+    """
+
+    def __init__(self, nnbrs, min_nbrs=1, min_sim=1e-6, save_nbrs=None, feedback='explicit',
+                 center=None, aggregate=None, n_jobs=None, memory_mb=1024, neighbor_dir=None, ann=None):
+        if feedback not in ('explicit', 'implicit'):
+            raise ValueError(f"unknown feedback {feedback!r}")
+        if center is None:
+            center = feedback == 'explicit'
+        if aggregate is None:
+            aggregate = 'weighted-average' if feedback == 'explicit' else 'sum'
+        if aggregate not in ('weighted-average', 'sum'):
+            raise ValueError(f"unknown aggregate {aggregate!r}")
+        if min_sim <= 0:
+            raise ValueError("ItemKNN needs a positive min_sim")
+        if neighbor_dir is not None and save_nbrs is None:
+            raise ValueError("neighbor_dir needs save_nbrs")
+        if neighbor_dir is not None and ann is not None:
+            raise ValueError("neighbor_dir and ann cannot be combined")
+        self.nnbrs = nnbrs
+        self.min_nbrs = min_nbrs
+        self.min_sim = min_sim
+        self.save_nbrs = save_nbrs
+        self.feedback = feedback
+        self.center = center
+        self.aggregate = aggregate
+        self.n_jobs = n_jobs
+        self.memory_mb = memory_mb
+        self.neighbor_dir = neighbor_dir
+        self.ann = ann
+
+    def get_params(self, deep=True):
+        """Constructor parameters (lets ``lenskit.util.clone`` copy the model)."""
+        return {name: getattr(self, name) for name in
+                ('nnbrs', 'min_nbrs', 'min_sim', 'save_nbrs', 'feedback', 'center', 'aggregate',
+                 'n_jobs', 'memory_mb', 'neighbor_dir', 'ann')}
+
+    def fit(self, ratings):
+        """Fit on a rating frame with user, item and (explicit feedback) rating columns."""
+        if self.feedback == 'implicit':
+            ratings = ratings[['user', 'item']]
+        store = Interactions.from_frame(ratings)
+        values = store.data
+        self.item_means_ = np.zeros(store.n_items, dtype=np.float32)
+        if self.center:
+            sums = np.bincount(store.indices, weights=values, minlength=store.n_items)
+            counts = np.bincount(store.indices, minlength=store.n_items)
+            self.item_means_ = (sums / np.maximum(counts, 1)).astype(np.float32)
+            values = values - self.item_means_[store.indices]
+        self.user_ids_ = store.user_ids
+        self.item_ids_ = store.item_ids
+        self.rated_ = sps.csr_matrix((values, store.indices, store.indptr),
+                                     shape=(store.n_users, store.n_items))
+        if self.ann is not None:
+            item_rows = self.rated_.T.tocsr()
+            self.lsh_ = type(self.ann)(**self.ann.get_params()).fit(item_rows)
+            self.sim_matrix_ = self.lsh_.neighbors(item_rows, self.save_nbrs, self.min_sim)
+        elif self.neighbor_dir is None:
+            self.sim_matrix_ = item_similarities(self.rated_, self.save_nbrs, self.min_sim,
+                                                 self.n_jobs, self.memory_mb)
+        else:
+            self.sim_matrix_ = write_neighbors(self.rated_, self.neighbor_dir, self.save_nbrs,
+                                               self.min_sim, self.n_jobs, self.memory_mb)
+        # row i of the transpose: the items that have i among their neighbours
+        if self.save_nbrs is None:
+            self.reverse_ = self.sim_matrix_
+        else:
+            self.reverse_ = self.sim_matrix_.T.tocsr()
+        return self
+
+    def _scores(self, code):
+        # scores of every item for the user with ``code`` (NaN when unscored);
+        # the similarities of the rated items are expanded to dense blocks of
+        # rated rows and the top ``nnbrs`` per target are merged block by block
+        start, end = self.rated_.indptr[code], self.rated_.indptr[code + 1]
+        rated = self.rated_.indices[start:end]
+        values = self.rated_.data[start:end]
+        n_items = len(self.item_ids_)
+        neighbors = self.reverse_[rated]
+        select = self.nnbrs is not None and self.nnbrs < len(rated)
+        step = max(1, _SCORE_CELLS // max(n_items, 1))
+
+        counts = np.zeros(n_items, dtype=np.int64)
+        sims = np.zeros((n_items, 0), dtype=np.float32)
+        weights = np.zeros((n_items, 0), dtype=np.float32)
+        for first in range(0, len(rated), step):
+            block = neighbors[first:first + step].toarray()
+            # stored similarities are >= min_sim > 0, so absent neighbours rank last
+            counts += np.count_nonzero(block, axis=0)
+            sims = np.concatenate([sims, block.T], axis=1)
+            if self.aggregate == 'sum':
+                # only the similarities themselves are needed
+                if select and sims.shape[1] > self.nnbrs:
+                    sims = np.partition(sims, -self.nnbrs, axis=1)[:, -self.nnbrs:]
+                continue
+            weights = np.concatenate([weights, np.broadcast_to(values[first:first + step], block.T.shape)],
+                                     axis=1)
+            if select and sims.shape[1] > self.nnbrs:
+                top = np.argpartition(-sims, self.nnbrs - 1, axis=1)[:, :self.nnbrs]
+                sims = np.take_along_axis(sims, top, axis=1)
+                weights = np.take_along_axis(weights, top, axis=1)
+
+        if self.aggregate == 'sum':
+            scores = sims.sum(axis=1, dtype=np.float64)
+        else:
+            total = np.abs(sims).sum(axis=1, dtype=np.float64)
+            scores = np.divide((sims * weights).sum(axis=1, dtype=np.float64), total,
+                               out=np.zeros(n_items), where=total > 0)
+            scores += self.item_means_
+        # as in LensKit, only the neighbours used for the score count towards min_nbrs
+        if select:
+            np.minimum(counts, self.nnbrs, out=counts)
+        scores[counts < self.min_nbrs] = np.nan
+        return scores, rated
+
+
+class UserKNN(_NeighborRecommender):
+    """User-user k-NN with the parameters of LensKit's ``UserUser``.
+
+    Users are compared by the cosine of their (optionally user-centred)
+    rating vectors.  An item is scored from the ``nnbrs`` most similar users
+    who rated it, aggregated with ``'sum'`` (sum of the similarities) or
+    ``'weighted-average'`` (of their ratings, plus the user's mean when
+    centred), and needs ``min_nbrs`` of them.  Only users with a positive
+    similarity of at least ``min_sim`` are neighbours, i.e. users who rated
+    an item in common.
+
+    ``fit`` builds an item -> users inverted index once.  Scoring a user
+    accumulates the dot products over the users found through the index
+    entries of the user's items, so the work is that of the user's
+    neighbourhood rather than a comparison with every user.  With ``ann``
+    (e.g. ``recsogood.ann.RandomProjectionLSH()``) the users are hashed at
+    fit time and a query is compared with the users sharing a bucket only.
+    """
+
+    def __init__(self, nnbrs, min_nbrs=1, min_sim=0, feedback='explicit', center=None, aggregate=None,
+                 ann=None):
+        if feedback not in ('explicit', 'implicit'):
+            raise ValueError(f"unknown feedback {feedback!r}")
+        if center is None:
+            center = feedback == 'explicit'
+        if aggregate is None:
+            aggregate = 'weighted-average' if feedback == 'explicit' else 'sum'
+        if aggregate not in ('weighted-average', 'sum'):
+            raise ValueError(f"unknown aggregate {aggregate!r}")
+        self.nnbrs = nnbrs
+        self.min_nbrs = min_nbrs
+        self.min_sim = min_sim
+        self.feedback = feedback
+        self.center = center
+        self.aggregate = aggregate
+        self.ann = ann
+
+    def get_params(self, deep=True):
+        """Constructor parameters (lets ``lenskit.util.clone`` copy the model)."""
+        return {name: getattr(self, name) for name in
+                ('nnbrs', 'min_nbrs', 'min_sim', 'feedback', 'center', 'aggregate', 'ann')}
+
+    def fit(self, ratings):
+        """Fit on a rating frame with user, item and (explicit feedback) rating columns."""
+        if self.feedback == 'implicit':
+            ratings = ratings[['user', 'item']]
+        store = Interactions.from_frame(ratings)
+        values = store.data
+        counts = np.diff(store.indptr)
+        self.user_means_ = np.zeros(store.n_users, dtype=np.float32)
+        if self.center:
+            sums = np.add.reduceat(values.astype(np.float64), store.indptr[:-1]) if store.nnz else 0
+            self.user_means_ = (np.where(counts > 0, sums, 0) / np.maximum(counts, 1)).astype(np.float32)
+            values = values - np.repeat(self.user_means_, counts)
+        norms = np.sqrt(np.add.reduceat(values.astype(np.float64) ** 2, store.indptr[:-1])) if store.nnz else 0
+        norms = np.where(counts > 0, norms, 0)
+        scale = np.divide(1.0, norms, out=np.zeros(store.n_users), where=norms > 0)
+        self.user_ids_ = store.user_ids
+        self.item_ids_ = store.item_ids
+        self.rated_ = sps.csr_matrix((values, store.indices, store.indptr),
+                                     shape=(store.n_users, store.n_items))
+        self.normalized_ = sps.csr_matrix(((values * np.repeat(scale, counts)).astype(np.float32),
+                                           store.indices, store.indptr),
+                                          shape=(store.n_users, store.n_items))
+        # row i: the users who rated item i and their normalized ratings
+        self.item_users_ = self.normalized_.T.tocsr()
+        if self.ann is not None:
+            self.lsh_ = type(self.ann)(**self.ann.get_params()).fit(self.normalized_)
+        return self
+
+    def _neighbors(self, code):
+        # neighbours of the user with ``code`` and their similarities, most similar first
+        if self.ann is None:
+            # dot products with the users who share an item, through the inverted index
+            start, end = self.rated_.indptr[code], self.rated_.indptr[code + 1]
+            index = self.item_users_
+            items = self.rated_.indices[start:end]
+            lengths = index.indptr[items + 1] - index.indptr[items]
+            positions = _ranges(index.indptr[items], lengths)
+            weights = np.repeat(self.normalized_.data[start:end], lengths) * index.data[positions]
+            sims = np.bincount(index.indices[positions], weights=weights, minlength=len(self.user_ids_))
+            sims[code] = 0
+            users = np.flatnonzero((sims > 0) & (sims >= self.min_sim))
+            sims = sims[users]
+        else:
+            # only the users sharing a hash bucket with this one are compared
+            users = self.lsh_.candidates(code)
+            start, end = self.normalized_.indptr[code], self.normalized_.indptr[code + 1]
+            query = np.zeros(len(self.item_ids_), dtype=np.float32)
+            query[self.normalized_.indices[start:end]] = self.normalized_.data[start:end]
+            sims = self.normalized_[users] @ query
+            keep = (sims > 0) & (sims >= self.min_sim)
+            users, sims = users[keep], sims[keep].astype(np.float64)
+        order = np.argsort(-sims, kind='stable')
+        return users[order], sims[order]
+
+    def _scores(self, code):
+        rated = self.rated_.indices[self.rated_.indptr[code]:self.rated_.indptr[code + 1]]
+        n_items = len(self.item_ids_)
+        scores = np.full(n_items, np.nan)
+        neighbors, sims = self._neighbors(code)
+        if not len(neighbors):
+            return scores, rated
+
+        rows = self.rated_
+        lengths = rows.indptr[neighbors + 1] - rows.indptr[neighbors]
+        counts = np.zeros(n_items, dtype=np.int64)
+        totals = np.zeros(n_items)
+        norms = np.zeros(n_items)
+        # walk the neighbours from the most similar down in chunks of about
+        # _RANK_CELLS ratings; an item takes its first nnbrs raters, so the
+        # ratings of items that already have them are dropped before ranking
+        bounds = np.append(0, np.cumsum(lengths))
+        first = 0
+        while first < len(neighbors):
+            last = max(first + 1, int(np.searchsorted(bounds, bounds[first] + _RANK_CELLS, 'right')) - 1)
+            chunk = slice(first, last)
+            first = last
+            positions = _ranges(rows.indptr[neighbors[chunk]], lengths[chunk])
+            items = rows.indices[positions]
+            chunk_sims = np.repeat(sims[chunk], lengths[chunk])
+            if self.nnbrs is not None:
+                filling = counts[items] < self.nnbrs
+                positions, items, chunk_sims = positions[filling], items[filling], chunk_sims[filling]
+                order = np.argsort(items.astype(np.uint16) if n_items <= 2 ** 16 else items, kind='stable')
+                sorted_items = items[order]
+                starts = np.ones(len(order), dtype=bool)
+                starts[1:] = sorted_items[1:] != sorted_items[:-1]
+                starts = np.flatnonzero(starts)
+                ranks = np.empty(len(order), dtype=np.int64)
+                ranks[order] = np.arange(len(order)) - np.repeat(starts, np.diff(np.append(starts, len(order))))
+                keep = ranks + counts[items] < self.nnbrs
+                positions, items, chunk_sims = positions[keep], items[keep], chunk_sims[keep]
+            counts += np.bincount(items, minlength=n_items)
+            if self.aggregate == 'sum':
+                totals += np.bincount(items, weights=chunk_sims, minlength=n_items)
+            else:
+                norms += np.bincount(items, weights=np.abs(chunk_sims), minlength=n_items)
+                totals += np.bincount(items, weights=chunk_sims * rows.data[positions], minlength=n_items)
+
+        if self.aggregate != 'sum':
+            totals = np.divide(totals, norms, out=np.zeros(n_items), where=norms > 0)
+            totals += self.user_means_[code]
+        scored = counts >= max(self.min_nbrs, 1)
+        scores[scored] = totals[scored]
+        return scores, rated
+
+
+def recpack_itemknn(directory, k_max=None, n_jobs=None, memory_mb=1024, name='ChunkedItemKNN'):
+    """RecPack ``ItemKNN`` subclass whose similarities come from ``write_neighbors``.
+
+    The subclass keeps RecPack's parameters and predictions (``X`` times the
+    top-``K`` cosine similarity rows; only the default ``similarity``,
+    ``pop_discount``, ``normalize_X`` and ``normalize_sim`` are supported),
+    but fits in blocks within ``memory_mb`` and spills the neighbours to
+    ``directory`` instead of building the dense item x item matrix.  With
+    ``k_max`` (e.g. the largest K of the grid) the file is written once for
+    ``k_max`` neighbours and every smaller K of a pipeline grid is read from
+    it.  The class is registered in RecPack's pipeline registry as ``name``.
+    """
+    from recpack.algorithms import ItemKNN as RecPackItemKNN
+    from recpack.pipelines import ALGORITHM_REGISTRY
+
+    class ChunkedItemKNN(RecPackItemKNN):
+
+        def _fit(self, X):
+            if (self.similarity != 'cosine' or self.pop_discount or self.normalize_X
+                    or self.normalize_sim):
+                raise ValueError(f"{name} only supports plain cosine similarity")
+            binary = sps.csr_matrix(X, dtype=np.float32, copy=True)
+            binary.data[:] = 1
+            write_neighbors(binary, directory, max(self.K, k_max or 0), 0.0, n_jobs, memory_mb)
+            self.similarity_matrix_ = load_neighbors(directory, self.K)
+
+    ChunkedItemKNN.__name__ = ChunkedItemKNN.__qualname__ = name
+    ALGORITHM_REGISTRY.register(name, ChunkedItemKNN)
+    return ChunkedItemKNN
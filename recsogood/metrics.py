@@ -0,0 +1,181 @@
+"""Evaluation of recommendation lists.
+
+``nDCG_LK`` scores a single user's list.  ``ndcg_scores`` groups the full
+recommendation and truth frames once and computes all per-user scores with
+NumPy, giving the same numbers as ``nDCG_LK(n, user_recs, user_truth)``.
+"""
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+
+@lru_cache(maxsize=None)
+def _ndcg_table(n):
+    # discount for ranks 1..n and IDCG@1..IDCG@n, shared by every caller
+    discount = 1.0 / np.log2(np.arange(1, n + 1, dtype=np.float64) + 1)
+    idcg = np.cumsum(discount)
+    discount.setflags(write=False)
+    idcg.setflags(write=False)
+    return discount, idcg
+
+
+class nDCG_LK:
+    """nDCG@n of one user's list, with IDCG taken at min(n, len(test_items)).
+
+    Drop-in replacement for the class the scripts used to define inline: the
+    discount/IDCG table is shared per ``n`` and the truth is hashed once, so
+    scoring a list costs O(len(top_items)).
+    """
+
+    def __init__(self, n, top_items, test_items):
+        self.n = n
+        self.top_items = top_items
+        self.test_items = test_items
+        self._truth = set(test_items)
+        self._discount, self._idcg = _ndcg_table(n)
+
+    def _ideal_dcg(self):
+        if len(self.test_items) < self.n:
+            return self._idcg[len(self.test_items) - 1]
+        return self._idcg[self.n - 1]
+
+    def calculate_dcg(self):
+        dcg = 0
+        for i, item in enumerate(self.top_items):
+            if item in self._truth:
+                dcg += self._discount[i] if i < self.n else 1.0 / np.log2(i + 2)
+        return dcg
+
+    def calculate(self):
+        dcg = self.calculate_dcg()
+        ideal_dcg = self._ideal_dcg()
+        if ideal_dcg == 0:
+            return 0
+        return dcg / ideal_dcg
+
+
+def _align(recs, truth, user_col, item_col):
+    """Group recommendations and truth by the users present in ``truth``.
+
+    Returns the users (in order of first appearance in ``truth``), the number
+    of truth rows per user, and for every recommendation row its user code,
+    its position in the user's list and whether it is a hit.
+    """
+    users = pd.unique(truth[user_col])
+    user_index = pd.Index(users)
+
+    t_users = user_index.get_indexer(truth[user_col])
+    counts = np.bincount(t_users, minlength=len(users))
+
+    r_users = user_index.get_indexer(recs[user_col])
+    keep = r_users >= 0
+    r_users = r_users[keep]
+    r_items = recs[item_col].to_numpy()[keep]
+
+    # stable sort keeps each user's list in frame (i.e. rank) order
+    order = np.argsort(r_users, kind='stable')
+    r_users = r_users[order]
+    r_items = r_items[order]
+    starts = np.searchsorted(r_users, r_users, side='left')
+    positions = np.arange(len(r_users)) - starts
+
+    # hit = (user, item) pair also present in the truth frame
+    item_codes, _ = pd.factorize(np.concatenate([truth[item_col].to_numpy(), r_items]))
+    n_items = item_codes.max() + 1 if len(item_codes) else 1
+    t_keys = t_users.astype(np.int64) * n_items + item_codes[:len(t_users)]
+    r_keys = r_users.astype(np.int64) * n_items + item_codes[len(t_users):]
+    hits = np.isin(r_keys, t_keys)
+
+    return users, counts, r_users, positions, hits
+
+
+def ndcg_scores(recs, truth, n=10, user_col='user', item_col='item'):
+    """Compute nDCG for every user in ``truth`` in one pass.
+
+    Follows ``nDCG_LK``: binary relevance, and the ideal DCG is taken at
+    ``min(n, number of truth items)``.  Users without recommendations score 0.
+
+    Returns a ``Series`` of per-user scores (indexed by user, in the order of
+    ``truth[user_col].unique()``) and their mean.
+    """
+    users, counts, r_users, positions, hits = _align(recs, truth, user_col, item_col)
+
+    max_len = positions.max() + 1 if len(positions) else 0
+    discount, idcg = _ndcg_table(max(n, max_len))
+
+    gains = np.where(hits, discount[positions], 0.0)
+    dcg = np.bincount(r_users, weights=gains, minlength=len(users))
+
+    ideal = idcg[np.clip(np.minimum(counts, n), 1, None) - 1]
+    scores = np.where(counts > 0, dcg / ideal, 0.0)
+
+    scores = pd.Series(scores, index=pd.Index(users, name=user_col), name='ndcg')
+    mean = scores.mean() if len(scores) else 0.0
+    return scores, mean
+
+
+METRICS = ('ndcg', 'precision', 'recall', 'map', 'hit_rate')
+
+
+def topn_metrics(recs, truth, cutoffs=(5, 10, 20, 50), metrics=METRICS,
+                 user_col='user', item_col='item'):
+    """Compute several top-N metrics at several cutoffs in one pass.
+
+    ``recs`` should hold each user's list at ``max(cutoffs)`` (e.g. one call
+    to ``batch.recommend(algo, users, max(cutoffs))``); shorter cutoffs are
+    read off the same hits matrix.  Definitions, with ``h`` the hits in the
+    first K positions and ``m`` the number of truth items of the user:
+
+    - ``ndcg``: as ``nDCG_LK``, with IDCG@min(K, m)
+    - ``precision``: h / K
+    - ``recall``: h / m
+    - ``map``: average precision over hit positions, divided by min(K, m)
+    - ``hit_rate``: 1 if h > 0
+
+    Returns a per-user frame with ``(metric, K)`` columns and a metric x K
+    frame of means.
+    """
+    cutoffs = sorted(set(cutoffs))
+    unknown = set(metrics) - set(METRICS)
+    if unknown:
+        raise ValueError(f"unknown metrics: {sorted(unknown)}")
+
+    users, counts, r_users, positions, hits = _align(recs, truth, user_col, item_col)
+    k_max = cutoffs[-1]
+
+    keep = positions < k_max
+    matrix = np.zeros((len(users), k_max), dtype=np.float64)
+    matrix[r_users[keep], positions[keep]] = hits[keep]
+
+    cum_hits = np.cumsum(matrix, axis=1)
+    discount, idcg = _ndcg_table(k_max)
+    ranks = np.arange(1, k_max + 1, dtype=np.float64)
+
+    if 'ndcg' in metrics:
+        cum_dcg = np.cumsum(matrix * discount, axis=1)
+    if 'map' in metrics:
+        cum_ap = np.cumsum(matrix * (cum_hits / ranks), axis=1)
+
+    safe_counts = np.maximum(counts, 1)
+    columns = {}
+    for k in cutoffs:
+        h = cum_hits[:, k - 1]
+        depth = np.clip(np.minimum(counts, k), 1, None)
+        for metric in metrics:
+            if metric == 'ndcg':
+                value = cum_dcg[:, k - 1] / idcg[depth - 1]
+            elif metric == 'precision':
+                value = h / k
+            elif metric == 'recall':
+                value = h / safe_counts
+            elif metric == 'map':
+                value = cum_ap[:, k - 1] / depth
+            else:
+                value = (h > 0).astype(np.float64)
+            columns[(metric, k)] = value
+
+    per_user = pd.DataFrame(columns, index=pd.Index(users, name=user_col))
+    per_user.columns = pd.MultiIndex.from_tuples(per_user.columns, names=['metric', 'K'])
+    summary = per_user.mean().unstack('K').reindex(list(metrics))
+    return per_user, summary
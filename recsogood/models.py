@@ -0,0 +1,102 @@
+"""Store fitted models so they can be rescored without refitting.
+
+``save_model`` pickles a fitted model (a LensKit ``Recommender``, a RecPack
+algorithm, ...) but writes every large numeric array it holds -- similarity
+matrices, factor matrices, popularity vectors, including the arrays inside
+scipy sparse matrices and pandas objects -- to its own ``.npy`` file.  The
+pickle that remains only describes the object structure, so ``load_model``
+reads it and memory maps the arrays: loading takes the same time whatever
+the model size, and pages are read from disk only when they are used.
+
+A stored model is a directory::
+
+    model.pkl       object structure, arrays replaced by references
+    arrays/0.npy    one file per array
+    meta.json       model class and array count
+"""
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+
+_PICKLE = 'model.pkl'
+_ARRAYS = 'arrays'
+_META = 'meta.json'
+
+
+class _ArrayPickler(pickle.Pickler):
+    # numeric arrays of at least ``min_bytes`` are written out as .npy files
+    # and pickled as a persistent reference to that file
+
+    def __init__(self, file, array_dir, min_bytes):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.array_dir = array_dir
+        self.min_bytes = min_bytes
+        self.saved = {}
+        self._keep = []
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, np.ndarray) or obj.dtype.hasobject or obj.nbytes < self.min_bytes:
+            return None
+        name = self.saved.get(id(obj))
+        if name is None:
+            name = f'{len(self.saved)}.npy'
+            np.save(os.path.join(self.array_dir, name), np.asarray(obj), allow_pickle=False)
+            self.saved[id(obj)] = name
+            # the id is only unique while the array is alive
+            self._keep.append(obj)
+        return name
+
+
+class _ArrayUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, array_dir, mmap_mode):
+        super().__init__(file)
+        self.array_dir = array_dir
+        self.mmap_mode = mmap_mode
+        self.loaded = {}
+
+    def persistent_load(self, name):
+        if name not in self.loaded:
+            self.loaded[name] = np.load(os.path.join(self.array_dir, name), mmap_mode=self.mmap_mode)
+        return self.loaded[name]
+
+
+def save_model(model, directory, min_bytes=64 * 2 ** 10):
+    """Write ``model`` to ``directory`` (replaced if it exists).
+
+    Arrays smaller than ``min_bytes`` stay inside the pickle.
+    """
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    try:
+        array_dir = os.path.join(tmp, _ARRAYS)
+        os.makedirs(array_dir)
+        with open(os.path.join(tmp, _PICKLE), 'wb') as f:
+            pickler = _ArrayPickler(f, array_dir, min_bytes)
+            pickler.dump(model)
+        meta = {'class': f'{type(model).__module__}.{type(model).__qualname__}',
+                'arrays': len(pickler.saved)}
+        with open(os.path.join(tmp, _META), 'w') as f:
+            json.dump(meta, f)
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.replace(tmp, directory)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def load_model(directory, mmap_mode='c'):
+    """Load a model written by ``save_model``.
+
+    The arrays are memory mapped with ``mmap_mode``; the default ``'c'``
+    (copy-on-write) lets the model modify them in memory without touching
+    the files.  Pass ``None`` to read them fully into memory instead.
+    """
+    with open(os.path.join(directory, _PICKLE), 'rb') as f:
+        return _ArrayUnpickler(f, os.path.join(directory, _ARRAYS), mmap_mode).load()
@@ -0,0 +1,87 @@
+"""Parallel top-N recommendation over a pool of worker processes.
+
+The fitted recommender is handed to the workers once, when the pool starts:
+with the ``fork`` start method (Linux, Colab) the workers inherit it from the
+parent without pickling, elsewhere it is pickled once per worker.  Tasks only
+carry chunks of user ids, and result chunks are streamed back in user order.
+"""
+import multiprocessing as mp
+import os
+
+import numpy as np
+import pandas as pd
+
+_model = None
+_n = None
+
+
+def default_jobs():
+    """Number of workers: ``RECSOGOOD_JOBS`` if set, else the CPU count."""
+    jobs = os.environ.get('RECSOGOOD_JOBS')
+    if jobs:
+        return int(jobs)
+    return os.cpu_count() or 1
+
+
+def _init_worker(model, n):
+    global _model, _n
+    _model = model
+    _n = n
+
+
+def _recommend_chunk(users):
+    frames = []
+    for user in users:
+        res = _model.recommend(user, _n)
+        res = res.assign(user=user, rank=np.arange(1, len(res) + 1))
+        frames.append(res)
+    if not frames:
+        return pd.DataFrame(columns=['item', 'score', 'user', 'rank'])
+    return pd.concat(frames, ignore_index=True)
+
+
+def _chunks(users, chunk_size):
+    for start in range(0, len(users), chunk_size):
+        yield users[start:start + chunk_size]
+
+
+def iter_recommend(algo, users, n, n_jobs=None, chunk_size=None):
+    """Yield recommendation frames for consecutive chunks of ``users``.
+
+    ``algo`` must already be fitted and expose ``recommend(user, n)`` (e.g. the
+    result of ``Recommender.adapt(...).fit(...)``).  Each frame has the columns
+    of ``lenskit.batch.recommend``: item, score, user and rank.
+    """
+    users = np.asarray(users)
+    if n_jobs is None:
+        n_jobs = default_jobs()
+    n_jobs = max(1, min(n_jobs, len(users)))
+    if chunk_size is None:
+        chunk_size = max(1, -(-len(users) // (n_jobs * 4)))
+
+    if n_jobs == 1:
+        _init_worker(algo, n)
+        try:
+            for chunk in _chunks(users, chunk_size):
+                yield _recommend_chunk(chunk)
+        finally:
+            _init_worker(None, None)
+        return
+
+    if 'fork' in mp.get_all_start_methods():
+        ctx = mp.get_context('fork')
+    else:
+        ctx = mp.get_context()
+    with ctx.Pool(n_jobs, initializer=_init_worker, initargs=(algo, n)) as pool:
+        yield from pool.imap(_recommend_chunk, _chunks(users, chunk_size))
+
+
+def recommend(algo, users, n, n_jobs=None, chunk_size=None):
+    """Recommend ``n`` items for every user, sharded over ``n_jobs`` workers.
+
+    Drop-in for ``batch.recommend(algo, users, n)``.
+    """
+    frames = list(iter_recommend(algo, users, n, n_jobs, chunk_size))
+    if not frames:
+        return pd.DataFrame(columns=['item', 'score', 'user', 'rank'])
+    return pd.concat(frames, ignore_index=True)
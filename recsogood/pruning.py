@@ -0,0 +1,106 @@
+"""k-core pruning of interaction tables.
+
+The scripts used to recompute ``value_counts`` and ``isin`` over the whole
+frame until nothing changed.  ``k_core`` instead peels the bipartite
+user-item graph: it keeps a degree counter per user and item, removes the
+nodes below the threshold, and only touches the interactions of removed
+nodes, so the total work is linear in the number of interactions however
+many rounds are needed.  The result is the same (unique) k-core.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _radix_order(codes, n):
+    # stable argsort of non-negative codes by 16-bit digits (numpy radix sorts
+    # uint16 keys), linear in len(codes)
+    order = np.argsort((codes & 0xFFFF).astype(np.uint16), kind='stable')
+    if n > 0x10000:
+        high = (codes >> 16).astype(np.uint16)
+        order = order[np.argsort(high[order], kind='stable')]
+    return order
+
+
+def _edge_lists(codes, n):
+    degree = np.bincount(codes, minlength=n)
+    ptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(degree, out=ptr[1:])
+    return degree, ptr, _radix_order(codes, n)
+
+
+def _gather(order, ptr, nodes):
+    # concatenated edge ids of all ``nodes`` (CSR range gather)
+    starts = ptr[nodes]
+    lengths = ptr[nodes + 1] - starts
+    total = lengths.sum()
+    if total == 0:
+        return np.empty(0, dtype=order.dtype)
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return order[offsets + np.arange(total)]
+
+
+def _peel(nodes, order, ptr, alive, other_codes, other_degree, other_removed, other_k):
+    # drop the alive edges of ``nodes``; return the neighbours that fell below k
+    edges = _gather(order, ptr, nodes)
+    edges = edges[alive[edges]]
+    alive[edges] = False
+    touched = other_codes[edges]
+    np.subtract.at(other_degree, touched, 1)
+    below = touched[(other_degree[touched] < other_k) & ~other_removed[touched]]
+    return np.unique(below), len(edges)
+
+
+def k_core(users, items, user_k=10, item_k=None):
+    """Find the interactions of the (user_k, item_k)-core.
+
+    ``users`` and ``items`` are equal-length arrays of ids (any hashable
+    type).  Returns a boolean mask selecting the interactions where every
+    remaining user has at least ``user_k`` and every remaining item at least
+    ``item_k`` interactions (``item_k`` defaults to ``user_k``), and a dict
+    with the number of peeling rounds and of removed interactions, users and
+    items.
+    """
+    if item_k is None:
+        item_k = user_k
+    user_codes, user_ids = pd.factorize(np.asarray(users))
+    item_codes, item_ids = pd.factorize(np.asarray(items))
+    n_users = len(user_ids)
+    n_items = len(item_ids)
+
+    user_degree, user_ptr, user_order = _edge_lists(user_codes, n_users)
+    item_degree, item_ptr, item_order = _edge_lists(item_codes, n_items)
+    alive = np.ones(len(user_codes), dtype=bool)
+    user_removed = np.zeros(n_users, dtype=bool)
+    item_removed = np.zeros(n_items, dtype=bool)
+
+    stats = {'rounds': 0, 'removed_interactions': 0, 'removed_users': 0, 'removed_items': 0}
+    user_front = np.flatnonzero(user_degree < user_k)
+    item_pending = np.flatnonzero(item_degree < item_k)
+    while len(user_front) or len(item_pending):
+        stats['rounds'] += 1
+
+        user_removed[user_front] = True
+        stats['removed_users'] += len(user_front)
+        below, removed = _peel(user_front, user_order, user_ptr, alive,
+                               item_codes, item_degree, item_removed, item_k)
+        stats['removed_interactions'] += removed
+
+        item_front = np.union1d(item_pending, below)
+        item_removed[item_front] = True
+        stats['removed_items'] += len(item_front)
+        user_front, removed = _peel(item_front, item_order, item_ptr, alive,
+                                    user_codes, user_degree, user_removed, user_k)
+        stats['removed_interactions'] += removed
+        item_pending = below[:0]
+
+    return alive, stats
+
+
+def prune_k_core(data, user_k=10, item_k=None, user_col='user', item_col='item'):
+    """Apply ``k_core`` to a rating frame.
+
+    Returns the pruned frame (original row order and index kept) and the
+    pruning statistics.
+    """
+    keep, stats = k_core(data[user_col].to_numpy(), data[item_col].to_numpy(), user_k, item_k)
+    return data[keep], stats
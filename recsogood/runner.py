@@ -0,0 +1,332 @@
+"""Run the datasets x algorithms x portions grid in one process.
+
+The experiment matrix is declared as a dict (or a JSON file)::
+
+    {
+        "datasets": {
+            "ML1M": {"format": "movielens", "path": ".../ml-1m"},
+            "Toys": {"format": "amazon", "path": ".../Toys_and_Games_5.json.gz", "clean": true}
+        },
+        "algorithms": {
+            "ItemKNN": {
+                "class": "lenskit.algorithms.item_knn:ItemItem",
+                "params": {"center": false, "aggregate": "sum", "feedback": "explicit"},
+                "grid": {"nnbrs": [10, 20, 30]}
+            }
+        },
+        "portions": [0.1, 0.5, 1.0],
+        "core": 10,
+        "seed": 42,
+        "n": 10
+    }
+
+``run_matrix`` turns it into a graph of stages.  Loading, pruning, splitting
+and downsampling are computed once per dataset (and portion) and shared by
+every algorithm; the pruned ratings are kept as one
+``recsogood.interactions.Interactions`` store per dataset, from which the
+LensKit frames are viewed.  A stage's result is released as soon as the last
+stage that needs it has run.  With ``"cache": {"dir": ..., "max_mb": ...}`` the pruned
+data, the splits and every cell's results are memoized on disk, so a rerun
+after an interrupted session resumes where it stopped.  Every fit,
+recommendation and evaluation is measured with ``recsogood.energy``, so each
+result row also carries the time and energy it cost.
+
+Tuning and testing follow the LensKit scripts: the train set is split per
+user into 10% test and 11.11% validation, the grid is evaluated on validation
+nDCG, and the best point is refit and scored on the test set.
+"""
+import argparse
+import importlib
+import itertools
+import json
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from . import parallel
+from .cache import StageCache, content_hash, fingerprint
+from .cleaning import clean_interactions
+from .datasets import _movielens_file, read_amazon_ratings, read_movielens
+from .energy import EnergyRecorder
+from .interactions import Interactions
+from .metrics import ndcg_scores
+from .pruning import prune_k_core
+from .sampling import nested_portions
+from .tuning import iteration_sweep, neighbor_sweep
+
+
+class StageGraph:
+    """Lazily evaluated stages with shared upstream results.
+
+    Every stage is computed at most once; its result is dropped when all the
+    stages depending on it have been computed.  With a ``StageCache``, stages
+    added with ``cached=True`` are also memoized on disk under a hash of
+    their name, parameters and the hashes of their inputs, so a rerun skips
+    every stage (and everything upstream of it) that already completed.
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache
+        self._stages = {}
+        self._results = {}
+        self._hashes = {}
+        self._pending = Counter()
+
+    def add(self, key, fn, *deps, params=None, cached=False):
+        if key in self._stages:
+            return key
+        self._stages[key] = (fn, deps, params, cached)
+        for dep in deps:
+            self._pending[dep] += 1
+        return key
+
+    def stage_hash(self, key):
+        if key not in self._hashes:
+            _, deps, params, _ = self._stages[key]
+            self._hashes[key] = content_hash(key[0], params, [self.stage_hash(dep) for dep in deps])
+        return self._hashes[key]
+
+    def get(self, key):
+        if key in self._results:
+            return self._results[key]
+        fn, deps, _, cached = self._stages[key]
+        if cached and self.cache is not None:
+            value = self.cache.memoize(self.stage_hash(key), self._compute, key)
+        else:
+            value = self._compute(key)
+        self._results[key] = value
+        # released on cache hits too, where the inputs were never fetched
+        for dep in deps:
+            self._pending[dep] -= 1
+            if self._pending[dep] == 0:
+                self._results.pop(dep, None)
+        return value
+
+    def _compute(self, key):
+        fn, deps, _, _ = self._stages[key]
+        return fn(*[self.get(dep) for dep in deps])
+
+
+def _import(spec):
+    module, _, name = spec.partition(':')
+    return getattr(importlib.import_module(module), name)
+
+
+def load_dataset(spec):
+    """Read a dataset described by ``{"format": ..., "path": ...}``."""
+    if spec['format'] == 'movielens':
+        return read_movielens(spec['path'])
+    if spec['format'] == 'amazon':
+        ratings, _, _ = read_amazon_ratings(spec['path'])
+        return ratings
+    raise ValueError(f"unknown dataset format {spec['format']!r}")
+
+
+def clean_ratings(ratings):
+    """Drop duplicate rows and average duplicate (user, item) ratings."""
+    return clean_interactions(ratings)[0]
+
+
+def split_ratings(ratings, seed):
+    """Per-user 10% test split, then 11.11% of the rest for validation."""
+    from lenskit import crossfold as xf
+
+    def _split(data, fraction):
+        train, test = [], []
+        for tp in xf.partition_users(data, 1, xf.SampleFrac(fraction, rng_spec=seed)):
+            train.append(tp.train)
+            test.append(tp.test)
+        return pd.concat(train), pd.concat(test)
+
+    train, test = _split(ratings, 0.10)
+    pure_train, valid = _split(train, 0.1111)
+    return {'train': pure_train, 'valid': valid, 'test': test}
+
+
+def _grid_points(grid):
+    names = list(grid)
+    for values in itertools.product(*[grid[name] for name in names]):
+        yield dict(zip(names, values))
+
+
+def sweep(spec, train):
+    """Yield ``(params, fitted recommender)`` over an algorithm's grid.
+
+    ``nnbrs`` and ``iterations`` grids use the single-fit sweeps from
+    ``recsogood.tuning``; other parameters are fit point by point.
+    """
+    from lenskit.algorithms import Recommender
+
+    cls = _import(spec['class'])
+    base = dict(spec.get('params', {}))
+    grid = dict(spec.get('grid', {}))
+    inner = None
+    for name in ('nnbrs', 'iterations'):
+        if name in grid:
+            inner = name, grid.pop(name)
+            break
+
+    for point in _grid_points(grid):
+        params = {**base, **point}
+        if inner is None:
+            rec = Recommender.adapt(cls(**params))
+            rec.fit(train)
+            yield params, rec
+            continue
+        name, values = inner
+        algo = cls(**params, **{name: max(values)})
+        inner_sweep = neighbor_sweep if name == 'nnbrs' else iteration_sweep
+        for value, rec in inner_sweep(algo, values, train):
+            yield {**params, name: value}, rec
+
+
+def evaluate(rec, truth, n, energy=None, **labels):
+    """Mean nDCG@n of ``rec`` on ``truth``; recommend and evaluate are measured."""
+    if energy is None:
+        energy = EnergyRecorder()
+    with energy.measure('recommend', **labels):
+        recs = parallel.recommend(rec, truth['user'].unique(), n)
+    with energy.measure('evaluate', **labels):
+        return ndcg_scores(recs, truth, n)[1]
+
+
+def _measured_fits(points, energy):
+    # the sweeps fit lazily, so the fit of a grid point is the work done to produce it
+    points = iter(points)
+    while True:
+        start = len(energy.rows)
+        with energy.measure('fit', phase='validation') as labels:
+            point = next(points, None)
+            if point is not None:
+                labels['params'] = json.dumps(point[0])
+        if point is None:
+            del energy.rows[start:]
+            return
+        yield point
+
+
+def tune_and_test(spec, train, valid, test, n, energy=None):
+    """Pick the best grid point on ``valid`` and score it on ``test``.
+
+    Fitting, recommendation and evaluation are measured with ``energy`` (an
+    ``EnergyRecorder``), labelled with the phase and grid point.
+    """
+    from lenskit.algorithms import Recommender
+
+    if energy is None:
+        energy = EnergyRecorder()
+    results = []
+    for params, rec in _measured_fits(sweep(spec, train), energy):
+        ndcg = evaluate(rec, valid, n, energy, phase='validation', params=json.dumps(params))
+        results.append({'stage': 'validation', 'params': params, 'ndcg': ndcg})
+    best = max(results, key=lambda r: r['ndcg'])['params']
+
+    rec = Recommender.adapt(_import(spec['class'])(**best))
+    with energy.measure('fit', phase='test', params=json.dumps(best)):
+        rec.fit(train)
+    ndcg = evaluate(rec, test, n, energy, phase='test', params=json.dumps(best))
+    results.append({'stage': 'test', 'params': best, 'ndcg': ndcg})
+    return results
+
+
+def run_cell(spec, data, n, seed=42, **labels):
+    """``tune_and_test`` on one split; returns the results and the measured stages.
+
+    numpy and LensKit's ``seedbank`` are seeded with ``seed`` first, so a
+    cell's results do not depend on the cells run before it in the process.
+    """
+    import seedbank
+
+    seedbank.initialize(seed)
+    np.random.seed(seed)
+    energy = EnergyRecorder(**labels)
+    results = tune_and_test(spec, data['train'], data['valid'], data['test'], n, energy)
+    return results, energy.rows
+
+
+def build_graph(matrix):
+    """Build the stage graph; returns it with the keys of the result stages."""
+    cache = None
+    if 'cache' in matrix:
+        cache = StageCache(matrix['cache']['dir'], int(matrix['cache'].get('max_mb', 10240) * 2 ** 20))
+    graph = StageGraph(cache)
+    seed = matrix.get('seed', 42)
+    core = matrix.get('core', 10)
+    n = matrix.get('n', 10)
+    portions = matrix.get('portions', [1.0])
+    outputs = []
+
+    for ds_name, ds in matrix['datasets'].items():
+        loaded = graph.add(('load', ds_name), lambda ds=ds: load_dataset(ds),
+                           params={**ds, 'source': fingerprint(_movielens_file(ds['path']))})
+        if ds.get('clean'):
+            loaded = graph.add(('clean', ds_name), clean_ratings, loaded, params={})
+        store = graph.add(('store', ds_name), lambda r: Interactions.from_frame(prune_k_core(r, core)[0]),
+                          loaded, params={'core': core}, cached=True)
+        split = graph.add(('split', ds_name), lambda s: split_ratings(s.to_frame(), seed), store,
+                          params={'seed': seed}, cached=True)
+        sampled = graph.add(('portions', ds_name),
+                            lambda s: (s, nested_portions(s['train']['user'].to_numpy(), portions, seed)),
+                            split, params={'portions': portions, 'seed': seed})
+
+        for portion in portions:
+            part = graph.add(('portion', ds_name, portion),
+                             lambda sp, p=portion: {**sp[0], 'train': sp[0]['train'].iloc[sp[1][p]]},
+                             sampled, params={'portion': portion})
+            for algo_name, spec in matrix['algorithms'].items():
+                key = ('run', ds_name, algo_name, portion)
+                labels = {'dataset': ds_name, 'algorithm': algo_name, 'portion': portion}
+                graph.add(key, lambda d, spec=spec, labels=labels: run_cell(spec, d, n, seed, **labels),
+                          part, params={**labels, 'spec': spec, 'n': n, 'seed': seed}, cached=True)
+                outputs.append(key)
+    return graph, outputs
+
+
+def run_matrix(matrix):
+    """Run every (dataset, algorithm, portion) cell.
+
+    Returns the results, one row per evaluated grid point with its nDCG and
+    the time and energy spent fitting, recommending and evaluating it, and
+    the ``EnergyRecorder`` rows of every measured stage.
+    """
+    graph, outputs = build_graph(matrix)
+    rows, stages = [], []
+    for key in outputs:
+        _, dataset, algorithm, portion = key
+        results, energy_rows = graph.get(key)
+        for result in results:
+            rows.append({'dataset': dataset, 'algorithm': algorithm, 'portion': portion, **result,
+                         'phase': result['stage'], 'params_key': json.dumps(result['params'])})
+        stages.extend(energy_rows)
+
+    keys = ['dataset', 'algorithm', 'portion', 'phase', 'params']
+    energy = pd.DataFrame(stages)
+    totals = energy.groupby(keys, as_index=False).agg(
+        wall_s=('wall_s', 'sum'), cpu_s=('cpu_s', 'sum'),
+        peak_rss_mb=('peak_rss_mb', 'max'), children_rss_mb=('children_rss_mb', 'max'),
+        energy_j=('energy_j', 'sum'))
+    results = pd.DataFrame(rows).merge(totals.rename(columns={'params': 'params_key'}),
+                                       on=keys[:-1] + ['params_key'], how='left')
+    return results.drop(columns=['phase', 'params_key']), energy
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('matrix', help='JSON file describing the experiment matrix')
+    parser.add_argument('-o', '--output', help='write the results to this CSV file')
+    parser.add_argument('--energy', help='write the per-stage measurements to this CSV file')
+    args = parser.parse_args(argv)
+
+    with open(args.matrix) as f:
+        matrix = json.load(f)
+    results, energy = run_matrix(matrix)
+    print(results.to_string())
+    if args.output:
+        results.to_csv(args.output, index=False)
+    if args.energy:
+        energy.to_csv(args.energy, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Nested per-user downsampling of training data.
+
+Each user's interactions are put in one seeded random order; the portion for
+fraction ``f`` keeps the first ``round(f * n)`` of them (halves rounded up),
+so every smaller portion is contained in every larger one and the result for
+a given seed does not depend on which fractions are requested together.
+"""
+import numpy as np
+import pandas as pd
+
+PORTIONS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+
+def portion_sizes(counts, fraction):
+    """Number of interactions kept for users with ``counts`` interactions."""
+    return np.minimum(np.floor(counts * fraction + 0.5), counts).astype(np.int64)
+
+
+def nested_portions(users, fractions=PORTIONS, seed=42):
+    """Split interactions into nested per-user portions from one permutation.
+
+    ``users`` holds the user of every interaction.  Returns a dict mapping
+    each fraction to the sorted positions of the interactions it keeps.
+    """
+    codes, _ = pd.factorize(np.asarray(users))
+    counts = np.bincount(codes)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+    rng = np.random.default_rng(seed)
+    order = np.lexsort((rng.random(len(codes)), codes))
+    ranks = np.empty(len(codes), dtype=np.int64)
+    ranks[order] = np.arange(len(codes)) - starts[codes[order]]
+
+    return {fraction: np.flatnonzero(ranks < portion_sizes(counts, fraction)[codes])
+            for fraction in fractions}
+
+
+def portion_frame(frame, fraction, seed=42, user_col='user'):
+    """Rows of ``frame`` in the ``fraction`` portion of ``nested_portions``."""
+    positions = nested_portions(frame[user_col].to_numpy(), [fraction], seed)[fraction]
+    return frame.iloc[positions]
+
+
+def iter_portions(frame, fractions=PORTIONS, seed=42, user_col='user'):
+    """Yield ``(fraction, rows)`` for every portion, from a single permutation."""
+    portions = nested_portions(frame[user_col].to_numpy(), fractions, seed)
+    for fraction in fractions:
+        yield fraction, frame.iloc[portions[fraction]]
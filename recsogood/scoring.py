@@ -0,0 +1,185 @@
+"""Blocked top-N scoring of matrix factorization models.
+
+Recommending with FunkSVD, BiasedMF, SVD or NMF means scoring every item for
+every user.  LensKit does this one user at a time through ``recommend``, and
+RecPack builds the dense users x items prediction matrix.  ``top_n_items``
+multiplies blocks of user factors with tiles of item factors small enough to
+stay in cache.  It sets the scores of each user's training items to -inf in
+place from the CSR row, and keeps a running top-N per user with
+``argpartition``, so only one tile of scores exists at a time.
+
+``lenskit_top_n`` applies it to a fitted LensKit MF model and returns the
+frame of ``batch.recommend``.  ``recpack_factorization`` registers RecPack
+``SVD``/``NMF`` subclasses whose predictions hold only the top-N scores.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sps
+
+from .parallel import default_jobs
+
+# score cells per tile: 2**16 float64 scores (512 KB) fit in a typical L2 cache
+_TILE_CELLS = 2 ** 16
+
+
+def _dense(array):
+    return array.toarray() if sps.issparse(array) else np.asarray(array)
+
+
+def _block_top_n(user_factors, item_factors, n, seen, item_bias, extra, clip, tile):
+    # top-n item codes and scores for one block of users, item tile by item tile;
+    # ``seen`` are the (row, item) codes to exclude, sorted by item
+    rows, columns = seen
+    n_users, n_items = len(user_factors), len(item_factors)
+    best_items = np.empty((n_users, 0), dtype=np.int64)
+    best_scores = np.empty((n_users, 0))
+    bounds = np.searchsorted(columns, np.arange(0, n_items + tile, tile))
+    for number, first in enumerate(range(0, n_items, tile)):
+        last = min(first + tile, n_items)
+        scores = user_factors @ item_factors[first:last].T
+        if item_bias is not None:
+            scores += item_bias[first:last]
+        if extra is not None:
+            scores += extra[:, None]
+        if clip is not None:
+            np.clip(scores, clip[0], clip[1], out=scores)
+        masked = slice(bounds[number], bounds[number + 1])
+        scores[rows[masked], columns[masked] - first] = -np.inf
+        best_scores = np.concatenate([best_scores, scores], axis=1)
+        best_items = np.concatenate([best_items, np.broadcast_to(np.arange(first, last), scores.shape)], axis=1)
+        if best_scores.shape[1] > n:
+            top = np.argpartition(-best_scores, n - 1, axis=1)[:, :n]
+            best_scores = np.take_along_axis(best_scores, top, axis=1)
+            best_items = np.take_along_axis(best_items, top, axis=1)
+    order = np.argsort(-best_scores, axis=1, kind='stable')
+    return np.take_along_axis(best_items, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+def top_n_items(user_factors, item_factors, n, seen=None, users=None, item_bias=None, user_bias=None,
+                clip=None, n_jobs=None, tile_cells=_TILE_CELLS, return_scores=False):
+    """Top-``n`` items of ``user_factors @ item_factors.T`` for every user.
+
+    ``user_factors`` is users x features, ``item_factors`` items x features.
+    ``seen`` (a users x items sparse matrix) marks the items to exclude per
+    user, e.g. the training ratings.  ``users`` are the rows to score
+    (default: all).  Scores are ``user . item + item_bias + user_bias``,
+    clipped to the ``(low, high)`` range ``clip`` when given.  Blocks of
+    users are scored on ``n_jobs`` threads (default ``RECSOGOOD_JOBS`` or
+    all CPUs), in tiles of about ``tile_cells`` scores.
+
+    Returns an int32 ``[len(users), n]`` array of item codes by decreasing
+    score, padded with -1 when a user has fewer than ``n`` unseen items,
+    and with ``return_scores`` also the float scores (-inf for padding).
+    """
+    user_factors, item_factors = _dense(user_factors), _dense(item_factors)
+    n_items = len(item_factors)
+    users = np.arange(len(user_factors)) if users is None else np.asarray(users, dtype=np.int64)
+    n = min(n, n_items)
+    if seen is not None:
+        seen = sps.csr_matrix(seen)
+    if n_jobs is None:
+        n_jobs = default_jobs()
+    tile = int(max(n, min(n_items, 4 * int(np.sqrt(tile_cells)))))
+    step = int(max(1, tile_cells // tile))
+
+    def run(first):
+        block = users[first:first + step]
+        if seen is None:
+            rows, columns = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        else:
+            part = seen[block].tocoo()
+            order = np.argsort(part.col, kind='stable')
+            rows, columns = part.row[order].astype(np.int64), part.col[order].astype(np.int64)
+        extra = None if user_bias is None else np.asarray(user_bias)[block]
+        return _block_top_n(user_factors[block], item_factors, n, (rows, columns), item_bias, extra,
+                            clip, tile)
+
+    # numpy's matrix products and partitioning release the GIL
+    with ThreadPoolExecutor(max(1, n_jobs)) as pool:
+        parts = list(pool.map(run, range(0, len(users), step)))
+    if parts:
+        items = np.concatenate([part[0] for part in parts])
+        scores = np.concatenate([part[1] for part in parts])
+    else:
+        items, scores = np.empty((0, n), dtype=np.int64), np.empty((0, n))
+    items = np.where(np.isneginf(scores), -1, items).astype(np.int32)
+    return (items, scores) if return_scores else items
+
+
+def lenskit_top_n(model, users, n, train, n_jobs=None):
+    """``batch.recommend``-style frame for a fitted LensKit MF model.
+
+    ``model`` is a fitted ``FunkSVD`` or ``BiasedMF`` (``als``), or the
+    ``Recommender.adapt`` around one.  Like LensKit's default candidate
+    selector, the items each user rated in ``train`` are excluded.  The
+    model's bias terms and FunkSVD's ``range`` clipping are applied.  Users
+    unknown to the model get no rows.  Returns item, score, user and rank
+    columns.
+    """
+    predictor = getattr(model, 'predictor', model)
+    user_index, item_index = predictor.user_index_, predictor.item_index_
+    users = pd.Index(users)
+    known = users[user_index.get_indexer(users) >= 0]
+    codes = user_index.get_indexer(known)
+
+    rows, columns = user_index.get_indexer(train['user']), item_index.get_indexer(train['item'])
+    keep = (rows >= 0) & (columns >= 0)
+    seen = sps.csr_matrix((np.ones(keep.sum(), dtype=np.int8), (rows[keep], columns[keep])),
+                          shape=(len(user_index), len(item_index)))
+    item_bias = user_bias = None
+    # without bias terms ``bias`` is None or, for ``BiasedMF(bias=False)``, False
+    bias = getattr(predictor, 'bias', None)
+    if getattr(bias, 'mean_', None) is not None:
+        item_bias = np.full(len(item_index), bias.mean_)
+        if bias.item_offsets_ is not None:
+            item_bias += bias.item_offsets_.reindex(item_index, fill_value=0).to_numpy()
+        if bias.user_offsets_ is not None:
+            user_bias = bias.user_offsets_.reindex(user_index, fill_value=0).to_numpy()
+    items, scores = top_n_items(predictor.user_features_, predictor.item_features_, n, seen, codes,
+                                item_bias, user_bias, getattr(predictor, 'range', None), n_jobs,
+                                return_scores=True)
+
+    found = items >= 0
+    return pd.DataFrame({
+        'item': item_index.take(items[found]),
+        'score': scores[found],
+        'user': np.repeat(known.to_numpy(), found.sum(axis=1)),
+        'rank': np.broadcast_to(np.arange(1, items.shape[1] + 1), items.shape)[found],
+    })
+
+
+def recpack_factorization(algorithm='SVD', n=100, exclude_seen=True, n_jobs=None, name=None):
+    """RecPack ``SVD`` or ``NMF`` subclass that predicts only the top-``n`` scores.
+
+    The subclass keeps RecPack's parameters and fit.  Its predictions for
+    the users with history in ``X`` hold their ``n`` highest scores, from
+    ``top_n_items``, instead of a dense row of every item.  With
+    ``exclude_seen`` (the default) the items in ``X`` are left out before
+    the top ``n`` is taken, which is what RecPack's pipeline removes with
+    its default ``remove_history``, so metrics at ``K <= n`` are unchanged.
+    Pass ``exclude_seen=False`` for a pipeline with ``remove_history`` off.
+    The class is registered in RecPack's pipeline registry as ``name``
+    (default ``'Blocked' + algorithm``).
+    """
+    from recpack import algorithms
+    from recpack.pipelines import ALGORITHM_REGISTRY
+
+    name = name or f'Blocked{algorithm}'
+
+    class BlockedFactorization(getattr(algorithms, algorithm)):
+
+        def _predict(self, X):
+            X = sps.csr_matrix(X)
+            users = np.flatnonzero(np.diff(X.indptr))
+            items, scores = top_n_items(self.user_embedding_, _dense(self.item_embedding_).T, n,
+                                        X if exclude_seen else None, users, n_jobs=n_jobs,
+                                        return_scores=True)
+            found = items >= 0
+            return sps.csr_matrix((scores[found], (np.repeat(users, found.sum(axis=1)), items[found])),
+                                  shape=X.shape)
+
+    BlockedFactorization.__name__ = BlockedFactorization.__qualname__ = name
+    ALGORITHM_REGISTRY.register(name, BlockedFactorization)
+    return BlockedFactorization
@@ -0,0 +1,141 @@
+"""Dataset statistics in one pass, cached next to the dataset.
+
+The scripts inspected their ratings with ``nunique``, ``value_counts``,
+``isnull``, ``duplicated`` and a ``groupby`` per plot, before and after
+pruning, every call scanning the whole frame again.  ``dataset_stats``
+derives all of it -- counts, users and items below the core threshold, empty
+and duplicate rows, degree summaries and log2 histograms, density, the
+rating distribution and the Gini coefficient of item popularity -- from the
+integer keys and the single sort that ``recsogood.cleaning`` uses.
+``cached_stats`` stores the result as JSON under ``.recsogood_cache`` next to
+the source file, keyed by the source and a hash of the frame, so reruns on
+the same data print the report after one hashing pass.
+"""
+import json
+import os
+
+import numpy as np
+
+from .cache import content_hash, fingerprint
+from .cleaning import _complete_rows, _sort_keys, _sort_rows
+from .datasets import _movielens_file
+
+
+def _degree_summary(degrees):
+    # degrees of the users (or items) that occur, with a histogram in
+    # power-of-two bins keyed by their lower bound
+    if not len(degrees):
+        return {'min': 0, 'median': 0.0, 'mean': 0.0, 'max': 0, 'histogram': {}}
+    bins = np.bincount(np.log2(degrees).astype(np.int64))
+    return {
+        'min': int(degrees.min()),
+        'median': float(np.median(degrees)),
+        'mean': float(degrees.mean()),
+        'max': int(degrees.max()),
+        'histogram': {str(2 ** b): int(count) for b, count in enumerate(bins) if count},
+    }
+
+
+def gini(values):
+    """Gini coefficient of non-negative ``values`` (0 = all equal)."""
+    values = np.sort(np.asarray(values, dtype=np.float64))
+    total = values.sum()
+    if not len(values) or total == 0:
+        return 0.0
+    ranks = np.arange(1, len(values) + 1)
+    return float(2 * (ranks * values).sum() / (len(values) * total) - (len(values) + 1) / len(values))
+
+
+def dataset_stats(frame, user_col='user', item_col='item', rating_col='rating', k=10):
+    """Summary statistics of a rating frame as a JSON-serializable dict.
+
+    ``interactions`` counts every row; ``empty_cells`` the missing values in
+    the three columns.  Everything else is computed on the complete rows:
+    ``users``/``items`` (distinct ids), ``users_below_k``/``items_below_k``,
+    ``duplicate_rows`` (repeated (user, item, rating) rows),
+    ``duplicate_ratings`` (repeated (user, item) pairs), ``density`` and
+    ``sparsity`` of the distinct pairs, ``user_degree``/``item_degree``
+    (min, median, mean, max and a log2 ``histogram``), ``item_gini`` and
+    ``ratings`` (count per rating value, keyed by the value as text).
+    """
+    users, items, ratings, empty_cells = _complete_rows(frame, user_col, item_col, rating_col)
+    user_keys, n_users = _sort_keys(users)
+    item_keys, n_items = _sort_keys(items)
+    _, pair_start, row_start = _sort_rows(user_keys, item_keys, n_items, ratings)
+
+    user_degrees = np.bincount(user_keys, minlength=n_users)
+    user_degrees = user_degrees[user_degrees > 0]
+    item_degrees = np.bincount(item_keys, minlength=n_items)
+    item_degrees = item_degrees[item_degrees > 0]
+    pairs = int(pair_start.sum())
+    cells = len(user_degrees) * len(item_degrees)
+    density = pairs / cells if cells else 0.0
+    values, counts = np.unique(ratings, return_counts=True)
+
+    return {
+        'interactions': len(frame),
+        'users': len(user_degrees),
+        'items': len(item_degrees),
+        'k': k,
+        'users_below_k': int((user_degrees < k).sum()),
+        'items_below_k': int((item_degrees < k).sum()),
+        'empty_cells': empty_cells,
+        'duplicate_rows': int(len(row_start) - row_start.sum()),
+        'duplicate_ratings': int(len(pair_start) - pairs),
+        'density': density,
+        'sparsity': 1.0 - density,
+        'user_degree': _degree_summary(user_degrees),
+        'item_degree': _degree_summary(item_degrees),
+        'item_gini': gini(item_degrees),
+        'ratings': {f'{value:g}': int(count) for value, count in zip(values, counts)},
+    }
+
+
+def cached_stats(source, frame, cache_dir=None, **options):
+    """``dataset_stats(frame, **options)``, cached as JSON next to ``source``.
+
+    The entry is keyed by ``fingerprint(source, **options)`` and the
+    ``content_hash`` of ``frame``, so a frame cleaned or pruned with other
+    parameters never gets a stale report.  A ``stage`` option (e.g.
+    ``'10-core'``) only labels the entry.  ``source`` may be a MovieLens
+    directory, in which case its ratings file is fingerprinted.
+    """
+    source = _movielens_file(source)
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(source)), '.recsogood_cache')
+    path = os.path.join(cache_dir, f'{fingerprint(source, frame=content_hash(frame), **options)}.stats.json')
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    options.pop('stage', None)
+    stats = dataset_stats(frame, **options)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f'{path}.tmp-{os.getpid()}'
+    with open(tmp, 'w') as f:
+        json.dump(stats, f)
+    os.replace(tmp, path)
+    return stats
+
+
+def print_stats(stats, title="Ratings Data Inspection:"):
+    """Print a ``dataset_stats`` dict in the scripts' inspection format."""
+    k = stats['k']
+    print(title)
+    print("Number of interactions:", stats['interactions'])
+    print("Number of unique users:", stats['users'])
+    print("Number of unique items:", stats['items'])
+    print(f"\nUsers with fewer than {k} interactions:", stats['users_below_k'])
+    print(f"Items with fewer than {k} interactions:", stats['items_below_k'])
+    print("\nNumber of empty rows:", stats['empty_cells'])
+    print("Number of duplicate rows:", stats['duplicate_rows'])
+    print("Number of duplicate ratings (same user, same item):", stats['duplicate_ratings'])
+    print(f"\nDensity: {stats['density']:.4%} (sparsity {stats['sparsity']:.4%})")
+    for name in ('user', 'item'):
+        degree = stats[f'{name}_degree']
+        print(f"Interactions per {name}: min {degree['min']}, median {degree['median']:g}, "
+              f"mean {degree['mean']:.2f}, max {degree['max']}")
+        print("  log2 bins: " + ", ".join(f"{low}+: {count}" for low, count in degree['histogram'].items()))
+    print(f"Gini of item popularity: {stats['item_gini']:.3f}")
+    total = sum(stats['ratings'].values()) or 1
+    print("Rating distribution (%): " + ", ".join(f"{value}: {100 * count / total:.1f}"
+                                                 for value, count in stats['ratings'].items()))
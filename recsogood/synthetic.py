@@ -0,0 +1,121 @@
+"""Synthetic rating data shaped like the thesis datasets.
+
+``synthetic_ratings`` draws a rating table with the user count, item count,
+interaction count and rating scale of ML100K, ML1M, ML10M or Amazon Toys and
+Games (5-core): user activity follows a log-normal distribution above the
+dataset's minimum, item popularity a Zipf law (MovieLens) or a log-normal
+distribution (Amazon), and ratings the skewed distribution of explicit star
+ratings.  Amazon's popularity tail is heavy enough that 10-core pruning keeps
+about a fifth of the interactions, as the scripts' split fractions expect,
+instead of collapsing to a few hundred users.  ``write_movielens`` and
+``write_amazon`` store it in the original file formats so the loaders can be
+exercised too.  Everything is generated locally from a seed.
+"""
+import gzip
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+SHAPES = {
+    'ml100k': {'users': 943, 'items': 1682, 'interactions': 100_000, 'min_user': 20,
+               'item_exponent': 0.9, 'ratings': (1, 2, 3, 4, 5),
+               'rating_weights': (0.06, 0.11, 0.27, 0.34, 0.22)},
+    'ml1m': {'users': 6040, 'items': 3706, 'interactions': 1_000_209, 'min_user': 20,
+             'item_exponent': 0.9, 'ratings': (1, 2, 3, 4, 5),
+             'rating_weights': (0.06, 0.11, 0.26, 0.35, 0.22)},
+    'ml10m': {'users': 69_878, 'items': 10_677, 'interactions': 10_000_054, 'min_user': 20,
+              'item_exponent': 1.0, 'ratings': (0.5, 1, 1.5, 2, 2.5, 3, 3.5, 4, 4.5, 5),
+              'rating_weights': (0.01, 0.04, 0.01, 0.08, 0.04, 0.24, 0.09, 0.29, 0.06, 0.14)},
+    'amazon-toys': {'users': 19_412, 'items': 11_924, 'interactions': 167_597, 'min_user': 5,
+                    'item_sigma': 2.0, 'ratings': (1, 2, 3, 4, 5),
+                    'rating_weights': (0.03, 0.04, 0.1, 0.21, 0.62),
+                    # rough size of the 10-core the Amazon scripts train on
+                    'core10_interactions': 34_000},
+}
+
+
+def _user_degrees(rng, users, interactions, min_user, max_user):
+    # log-normal activity above the minimum, rescaled to the interaction count
+    extra = rng.lognormal(0.0, 1.2, users)
+    extra *= (interactions - users * min_user) / extra.sum()
+    degrees = np.minimum(min_user + np.floor(extra).astype(np.int64), max_user)
+    # hand the rounding remainder to random users that still have room
+    while degrees.sum() < interactions:
+        room = np.flatnonzero(degrees < max_user)
+        missing = interactions - degrees.sum()
+        degrees[rng.choice(room, min(missing, len(room)), replace=False)] += 1
+    return degrees
+
+
+def synthetic_ratings(shape='ml1m', scale=1.0, seed=42, user_col='user', item_col='item',
+                      rating_col='rating'):
+    """Generate a rating frame with the shape of a dataset in ``SHAPES``.
+
+    ``shape`` is a key of ``SHAPES`` or a dict with the same fields
+    (``item_sigma`` for log-normal item popularity, else ``item_exponent``);
+    ``scale`` multiplies the user and interaction counts (items scale with
+    its square root, which keeps the density of the real data roughly
+    unchanged).  Every user rates each item at most once.  Ids are int32
+    starting at 1 and ratings float32, like ``read_movielens``.
+    """
+    if isinstance(shape, str):
+        shape = SHAPES[shape]
+    rng = np.random.default_rng(seed)
+    users = max(1, int(round(shape['users'] * scale)))
+    items = max(shape['min_user'], int(round(shape['items'] * np.sqrt(scale))))
+    # the most active real users rated about half of the catalogue
+    max_user = max(shape['min_user'], items // 2)
+    interactions = max(users * shape['min_user'], int(round(shape['interactions'] * scale)))
+    interactions = min(interactions, users * max_user)
+
+    degrees = _user_degrees(rng, users, interactions, shape['min_user'], max_user)
+    if 'item_sigma' in shape:
+        popularity = rng.lognormal(0.0, shape['item_sigma'], items)
+    else:
+        popularity = np.arange(1, items + 1, dtype=np.float64) ** -shape['item_exponent']
+        popularity = popularity[rng.permutation(items)]
+    log_popularity = np.log(popularity)
+
+    # weighted sampling without replacement per user (Gumbel top-k), in user blocks
+    user_codes = np.repeat(np.arange(users, dtype=np.int32), degrees)
+    item_codes = np.empty(interactions, dtype=np.int32)
+    start = 0
+    block = max(1, 2 ** 22 // items)
+    for first in range(0, users, block):
+        block_degrees = degrees[first:first + block]
+        width = block_degrees.max()
+        keys = rng.gumbel(size=(len(block_degrees), items))
+        keys += log_popularity
+        top = np.argpartition(-keys, width - 1, axis=1)[:, :width]
+        chosen = top[np.arange(width) < block_degrees[:, None]]
+        item_codes[start:start + len(chosen)] = chosen
+        start += len(chosen)
+
+    ratings = rng.choice(np.asarray(shape['ratings'], dtype=np.float32), interactions,
+                         p=np.asarray(shape['rating_weights']) / sum(shape['rating_weights']))
+    frame = pd.DataFrame({user_col: user_codes + 1, item_col: item_codes + 1, rating_col: ratings})
+    return frame.iloc[rng.permutation(interactions)].reset_index(drop=True)
+
+
+def write_movielens(frame, path, user_col='user', item_col='item', rating_col='rating'):
+    """Write ``frame`` as an ML1M/ML10M ``ratings.dat`` (``::`` separated)."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    timestamps = np.arange(len(frame), dtype=np.int64) + 956703932
+    lines = (frame[user_col].astype(str) + '::' + frame[item_col].astype(str) + '::'
+             + frame[rating_col].map('{:g}'.format) + '::' + pd.Series(timestamps, index=frame.index).astype(str))
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines))
+        f.write('\n')
+
+
+def write_amazon(frame, path, user_col='user', item_col='item', rating_col='rating'):
+    """Write ``frame`` as a gzipped Amazon review file (one JSON object per line)."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for user, item, rating in zip(frame[user_col], frame[item_col], frame[rating_col]):
+            f.write(json.dumps({'overall': float(rating), 'verified': True,
+                                'reviewerID': f'A{user:012d}', 'asin': f'B{item:09d}',
+                                'reviewText': 'synthetic review', 'summary': 'synthetic'}))
+            f.write('\n')
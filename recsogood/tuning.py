@@ -0,0 +1,138 @@
+"""Hyperparameter sweeps that reuse work between grid points.
+
+The LensKit scripts fit a fresh model for every grid value.  The sweeps here
+fit once and derive the other grid points from that fit where the algorithm
+allows it, yielding ready-to-use recommenders that can be scored with
+``evaluate_fitted``.
+"""
+import numpy as np
+import scipy.sparse as sps
+
+from . import parallel
+from .metrics import ndcg_scores
+from .scoring import lenskit_top_n
+
+
+def evaluate_fitted(aname, algo, valid, n=10, train=None):
+    """Like the scripts' ``evaluate_with_ndcg``, for an already fitted recommender.
+
+    With ``train``, ``algo`` is a LensKit MF model and is scored in blocks by
+    ``recsogood.scoring.lenskit_top_n``, excluding the ``train`` items.
+    """
+    users = valid.user.unique()
+    if train is None:
+        recs = parallel.recommend(algo, users, n)
+    else:
+        recs = lenskit_top_n(algo, users, n, train)
+    recs['Algorithm'] = aname
+    user_ndcg, mean_ndcg = ndcg_scores(recs, valid, n)
+    return recs, mean_ndcg
+
+
+def _top_n(predictor, train):
+    # TopN around an already fitted predictor; only the candidate selector is fitted
+    from lenskit.algorithms.basic import TopN
+
+    rec = TopN(predictor)
+    rec.selector.fit(train)
+    return rec
+
+
+def iteration_sweep(algo, iterations, train):
+    """Yield ``(n_iterations, recommender)`` for every value in ``iterations``.
+
+    Algorithms with ``fit_iters`` (e.g. ``BiasedMF``) are trained once up to
+    ``max(iterations)`` and the recommender is yielded at each requested
+    checkpoint, which gives the same model as a fresh fit with that many
+    iterations.  The model keeps training when the generator resumes, so use
+    the recommender before asking for the next one.
+
+    Other algorithms are refit from scratch for every value.  This is the
+    case for ``FunkSVD``, which trains one feature at a time for all of its
+    iterations, so a shorter run is not a prefix of a longer one.
+    """
+    from lenskit import util
+    from lenskit.algorithms import Recommender
+
+    wanted = sorted(set(iterations))
+    if not hasattr(algo, 'fit_iters'):
+        for count in wanted:
+            model = util.clone(algo)
+            model.iterations = count
+            model = Recommender.adapt(model)
+            model.fit(train)
+            yield count, model
+        return
+
+    model = util.clone(algo)
+    model.iterations = wanted[-1]
+    rec = _top_n(model, train)
+    for epoch, _ in enumerate(model.fit_iters(train), 1):
+        if epoch in wanted:
+            yield epoch, rec
+        if epoch == wanted[-1]:
+            break
+
+
+def neighbor_sweep(algo, k_values, train):
+    """Yield ``(k, recommender)`` for a LensKit ``ItemItem``/``UserUser`` K grid.
+
+    The similarity model does not depend on ``nnbrs`` (LensKit applies it at
+    scoring time, among the items the user rated or the users who rated the
+    item), so the model is fitted once and only ``nnbrs`` is changed between
+    grid points.  Truncating the stored neighbour lists to the top-Kmax would
+    change LensKit's scores, so the full model is kept.  ``recsogood.knn``
+    models recommend by themselves and are used without a LensKit wrapper.
+    """
+    from lenskit import util
+    from lenskit.algorithms import Recommender
+
+    model = util.clone(algo)
+    model.nnbrs = max(k_values)
+    rec = model if hasattr(model, 'recommend') else Recommender.adapt(model)
+    rec.fit(train)
+    for k in k_values:
+        model.nnbrs = k
+        yield k, rec
+
+
+def truncate_neighbors(sim, k):
+    """Keep the ``k`` largest entries of every row of a sparse similarity matrix."""
+    sim = sps.csr_matrix(sim)
+    rows = np.repeat(np.arange(sim.shape[0]), np.diff(sim.indptr))
+    order = np.lexsort((-sim.data, rows))
+    ranks = np.arange(len(order)) - sim.indptr[rows[order]]
+    keep = np.sort(order[ranks < k])
+    indptr = np.zeros(sim.shape[0] + 1, dtype=sim.indptr.dtype)
+    np.cumsum(np.bincount(rows[keep], minlength=sim.shape[0]), out=indptr[1:])
+    return sps.csr_matrix((sim.data[keep], sim.indices[keep], indptr), shape=sim.shape)
+
+
+def itemknn_k_sweep(k_values, X, directory=None, memory_mb=1024, **params):
+    """Yield ``(K, model)`` for a RecPack ``ItemKNN`` K grid from one fit.
+
+    RecPack keeps the top-K neighbours of every item at fit time, so the
+    model for a smaller K is the top-K slice of the rows of the Kmax model.
+    Only valid when ``normalize_sim`` is off (the default), since normalizing
+    after truncation depends on K.
+
+    With ``directory``, the Kmax neighbours are computed by
+    ``recsogood.knn.write_neighbors`` in blocks within ``memory_mb`` and
+    memory mapped from there, instead of by RecPack's dense fit (plain
+    cosine similarity only).
+    """
+    from recpack.algorithms import ItemKNN
+
+    if params.get('normalize_sim'):
+        raise ValueError("itemknn_k_sweep requires normalize_sim=False")
+    if directory is None:
+        base = ItemKNN(K=max(k_values), **params)
+    else:
+        from .knn import recpack_itemknn
+
+        base = recpack_itemknn(directory, memory_mb=memory_mb)(K=max(k_values), **params)
+    base.fit(X)
+    for k in k_values:
+        model = ItemKNN(K=k, **params)
+        model.similarity_matrix_ = truncate_neighbors(base.similarity_matrix_, k)
+        yield k, model
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from recsogood.cleaning import clean_interactions
+
+
+def _ratings(seed, ids):
+    rng = np.random.default_rng(seed)
+    n = 2000
+    frame = pd.DataFrame({
+        'user': rng.integers(0, 50, n),
+        'item': rng.integers(0, 40, n),
+        'rating': rng.integers(1, 11, n) / 2,
+        'timestamp': rng.integers(0, 10 ** 9, n),
+    })
+    if ids == 'str':
+        frame['user'] = 'u' + frame['user'].astype(str)
+        frame['item'] = 'i' + frame['item'].astype(str)
+    # exact duplicate rows, and missing ids and ratings
+    frame = pd.concat([frame, frame.sample(200, random_state=seed)], ignore_index=True)
+    frame.loc[rng.choice(len(frame), 30, replace=False), 'rating'] = np.nan
+    frame.loc[rng.choice(len(frame), 10, replace=False), 'item'] = None
+    return frame
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('ids', ['int', 'str'])
+def test_clean_interactions_matches_pandas(seed, ids):
+    frame = _ratings(seed, ids)
+    columns = ['user', 'item', 'rating']
+    complete = frame.dropna(subset=columns)[columns]
+    expected = complete.drop_duplicates().groupby(['user', 'item'], as_index=False)['rating'].mean()
+
+    cleaned, stats = clean_interactions(frame)
+    pd.testing.assert_frame_equal(cleaned, expected, check_dtype=False)
+    assert stats['rows'] == len(frame)
+    assert stats['empty_cells'] == frame[columns].isna().sum().sum()
+    assert stats['duplicate_rows'] == complete.duplicated().sum()
+    assert stats['duplicate_ratings'] == complete.duplicated(['user', 'item']).sum()
+    assert stats['rows_after'] == len(expected)
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from recsogood.datasets import compact_ratings, read_movielens
+
+ROWS = [(1, 1193, 5, 978300760), (1, 661, 3, 978302109), (2, 3408, 4.5, 978300275),
+        (6040, 65133, 0.5, 1231131736)]
+
+
+def _write(path, sep):
+    path.write_text(''.join(sep.join(str(v) for v in row) + '\n' for row in ROWS))
+    return str(path)
+
+
+@pytest.mark.parametrize('sep, name', [('::', 'ratings.dat'), ('\t', 'u.data')])
+def test_read_movielens_is_compact(tmp_path, sep, name):
+    _write(tmp_path / name, sep)
+    ratings = read_movielens(str(tmp_path))
+
+    assert list(ratings.columns) == ['user', 'item', 'rating']
+    assert ratings['user'].dtype == np.int32
+    assert ratings['item'].dtype == np.int32
+    assert ratings['rating'].dtype == np.float32
+    assert ratings['rating'].tolist() == [5, 3, 4.5, 0.5]
+
+    ratings = read_movielens(str(tmp_path / name), timestamp=True)
+    assert ratings['timestamp'].dtype == np.int64
+
+
+def test_read_movielens_matches_python_engine(tmp_path):
+    path = _write(tmp_path / 'ratings.dat', '::')
+    column_names = ['user_id', 'item_id', 'rating', 'timestamp']
+    expected = pd.read_csv(path, sep='::', names=column_names, engine='python',
+                           usecols=['user_id', 'item_id', 'rating'])
+
+    ratings = read_movielens(path, user_col='user_id', item_col='item_id')
+    pd.testing.assert_frame_equal(ratings, expected, check_dtype=False)
+
+
+def test_compact_ratings_refuses_lossy_conversions():
+    frame = pd.DataFrame({'user': [1, 2], 'item': [3, 4], 'rating': [1.0, 2.5],
+                          'timestamp': [10, 20]})
+    compact = compact_ratings(frame)
+    assert list(compact.columns) == ['user', 'item', 'rating']
+    assert compact['user'].dtype == np.int32
+    assert compact['rating'].dtype == np.float32
+    assert compact_ratings(frame, keep=['timestamp'])['timestamp'].tolist() == [10, 20]
+
+    with pytest.raises(ValueError):
+        compact_ratings(frame.assign(item=[3, 2 ** 31]))
+    with pytest.raises(ValueError):
+        compact_ratings(frame.assign(rating=[1.0, 0.1]))
@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from recsogood.interactions import Interactions
+
+
+def _store():
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({'user': rng.integers(0, 30, 200) * 7, 'item': rng.integers(0, 20, 200) * 3,
+                          'rating': rng.integers(1, 6, 200).astype(np.float32)})
+    return Interactions.from_frame(frame.drop_duplicates(['user', 'item']))
+
+
+def test_to_recpack_matches_interaction_matrix():
+    recpack_matrix = pytest.importorskip('recpack.matrix')
+    store = _store()
+    frame = store.to_frame(codes=True)
+    expected = recpack_matrix.InteractionMatrix(frame, 'item', 'user', shape=(store.n_users, store.n_items))
+
+    matrix = store.to_recpack()
+    assert matrix.shape == (store.n_users, store.n_items)
+    assert (matrix.values != expected.values).nnz == 0
+    assert (matrix.values != store.csr.astype(bool)).nnz == 0
+    pd.testing.assert_frame_equal(matrix._df, expected._df, check_dtype=False)
@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse as sps
+
+from recsogood.knn import ItemKNN, UserKNN, item_similarities, load_neighbors, write_neighbors
+
+
+def _ratings(seed=0, n_users=40, n_items=25):
+    rng = np.random.default_rng(seed)
+    mask = rng.random((n_users, n_items)) < 0.3
+    users, items = np.nonzero(mask)
+    ratings = rng.integers(1, 11, len(users)) / 2
+    # ids that are not codes, in shuffled order
+    frame = pd.DataFrame({'user': users * 3 + 7, 'item': items * 5 + 2, 'rating': ratings})
+    return frame.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def _dense(frame):
+    users = np.sort(frame['user'].unique())
+    items = np.sort(frame['item'].unique())
+    matrix = np.full((len(users), len(items)), np.nan)
+    matrix[np.searchsorted(users, frame['user']), np.searchsorted(items, frame['item'])] = frame['rating']
+    return users, items, matrix
+
+
+def _cosine(vectors):
+    norms = np.linalg.norm(vectors, axis=1)
+    norms[norms == 0] = 1
+    unit = vectors / norms[:, None]
+    sims = unit @ unit.T
+    np.fill_diagonal(sims, 0)
+    return sims
+
+
+def _top_k_dense(sims, k, min_sim):
+    # row i keeps its k largest similarities of at least min_sim
+    kept = np.where(sims >= min_sim, sims, 0)
+    if k is not None:
+        for row in kept:
+            row[np.argsort(-row, kind='stable')[k:]] = 0
+    return kept
+
+
+def _aggregate(sims, values, nnbrs, min_nbrs, aggregate, offset):
+    # score from the ``nnbrs`` most similar neighbours with a similarity > 0
+    order = np.argsort(-sims, kind='stable')
+    order = order[sims[order] > 0][:nnbrs]
+    if len(order) < max(min_nbrs, 1):
+        return np.nan
+    if aggregate == 'sum':
+        return sims[order].sum()
+    return (sims[order] * values[order]).sum() / np.abs(sims[order]).sum() + offset
+
+
+def _item_knn_reference(matrix, nnbrs, min_nbrs, min_sim, save_nbrs, aggregate, center=True):
+    rated = ~np.isnan(matrix)
+    means = np.nanmean(matrix, axis=0) if center else np.zeros(matrix.shape[1])
+    values = np.where(rated, matrix - means, 0)
+    sims = _top_k_dense(_cosine(values.T), save_nbrs, min_sim)
+    scores = np.full(matrix.shape, np.nan)
+    for u in range(len(matrix)):
+        for i in range(matrix.shape[1]):
+            neighbors = np.where(rated[u], sims[i], 0)
+            scores[u, i] = _aggregate(neighbors, values[u], nnbrs, min_nbrs, aggregate, means[i])
+    return scores
+
+
+def _user_knn_reference(matrix, nnbrs, min_nbrs, min_sim, aggregate):
+    rated = ~np.isnan(matrix)
+    means = np.nanmean(matrix, axis=1)
+    values = np.where(rated, matrix - means[:, None], 0)
+    sims = _cosine(values)
+    sims[sims < min_sim] = 0
+    scores = np.full(matrix.shape, np.nan)
+    for u in range(len(matrix)):
+        for i in range(matrix.shape[1]):
+            neighbors = np.where(rated[:, i], sims[u], 0)
+            scores[u, i] = _aggregate(neighbors, values[:, i], nnbrs, min_nbrs, aggregate, means[u])
+    return scores
+
+
+def _predictions(model, users, items):
+    return np.array([model.predict_for_user(user, items).to_numpy() for user in users])
+
+
+def test_item_similarities_match_dense_cosine():
+    users, items, matrix = _dense(_ratings())
+    values = np.nan_to_num(matrix)
+    for k, min_sim in [(None, 1e-6), (5, 1e-6), (5, 0.3)]:
+        expected = _top_k_dense(_cosine(values.T), k, min_sim)
+        sims = item_similarities(sps.csr_matrix(values), k, min_sim, n_jobs=2, memory_mb=0.001)
+        assert sims.indices.dtype == np.int32 and sims.dtype == np.float32
+        assert np.allclose(sims.toarray(), expected, atol=1e-6)
+        # every row by decreasing similarity
+        for row in range(sims.shape[0]):
+            data = sims.data[sims.indptr[row]:sims.indptr[row + 1]]
+            assert (np.diff(data) <= 0).all()
+
+
+@pytest.mark.parametrize('aggregate', ['weighted-average', 'sum'])
+@pytest.mark.parametrize('nnbrs, min_nbrs, min_sim, save_nbrs', [
+    (20, 1, 1e-6, None), (3, 1, 1e-6, None), (3, 2, 0.1, 8),
+])
+def test_item_knn_matches_dense_reference(aggregate, nnbrs, min_nbrs, min_sim, save_nbrs):
+    frame = _ratings(1)
+    users, items, matrix = _dense(frame)
+    model = ItemKNN(nnbrs, min_nbrs, min_sim, save_nbrs, aggregate=aggregate, n_jobs=2, memory_mb=0.001)
+    model.fit(frame)
+
+    expected = _item_knn_reference(matrix, nnbrs, min_nbrs, min_sim, save_nbrs, aggregate)
+    assert np.allclose(_predictions(model, users, items), expected, equal_nan=True, atol=1e-5)
+
+    # nnbrs is applied at scoring time, so it can change after fitting
+    model.nnbrs = 1
+    expected = _item_knn_reference(matrix, 1, min_nbrs, min_sim, save_nbrs, aggregate)
+    assert np.allclose(_predictions(model, users, items), expected, equal_nan=True, atol=1e-5)
+
+
+def test_item_knn_recommends_unrated_items_by_score():
+    frame = _ratings(2)
+    users, items, matrix = _dense(frame)
+    model = ItemKNN(5).fit(frame)
+    expected = _item_knn_reference(matrix, 5, 1, 1e-6, None, 'weighted-average')
+    for u, user in enumerate(users[:5]):
+        recs = model.recommend(user, 4)
+        scores = np.where(np.isnan(matrix[u]), expected[u], np.nan)
+        order = np.argsort(-np.nan_to_num(scores, nan=-np.inf), kind='stable')[:len(recs)]
+        assert np.allclose(recs['score'].to_numpy(), scores[order], atol=1e-5)
+        assert set(recs['item']).isdisjoint(frame.loc[frame['user'] == user, 'item'])
+    assert model.recommend(-1, 4).empty
+
+
+@pytest.mark.parametrize('aggregate', ['weighted-average', 'sum'])
+@pytest.mark.parametrize('nnbrs, min_nbrs, min_sim', [(None, 1, 0), (3, 1, 0), (5, 2, 0.2)])
+def test_user_knn_matches_dense_reference(aggregate, nnbrs, min_nbrs, min_sim):
+    frame = _ratings(3)
+    users, items, matrix = _dense(frame)
+    model = UserKNN(nnbrs, min_nbrs, min_sim, aggregate=aggregate).fit(frame)
+
+    expected = _user_knn_reference(matrix, nnbrs, min_nbrs, min_sim, aggregate)
+    assert np.allclose(_predictions(model, users, items), expected, equal_nan=True, atol=1e-5)
+
+
+def test_write_neighbors_pads_with_zeros_and_round_trips(tmp_path):
+    users, items, matrix = _dense(_ratings(4))
+    values = sps.csr_matrix(np.nan_to_num(matrix))
+    directory = str(tmp_path / 'neighbors')
+
+    # more columns than there are similarities of at least min_sim
+    written = write_neighbors(values, directory, 15, min_sim=0.3, n_jobs=2, memory_mb=0.001)
+    expected = _top_k_dense(_cosine(values.toarray().T), 15, 0.3)
+    assert written.shape == (len(items), len(items))
+    assert np.array_equal(np.diff(written.indptr), np.full(len(items), 15))
+    assert np.allclose(written.toarray(), expected, atol=1e-6)
+    stored = written.data.reshape(len(items), 15)
+    assert (np.diff(stored, axis=1) <= 0).all() and (stored[:, -1] == 0).any()
+
+    # the mmap round trip, and fewer columns read off the same file
+    loaded = load_neighbors(directory)
+    # views of the memory-mapped files, not copies
+    for array in (loaded.data, loaded.indices):
+        while not isinstance(array, np.memmap):
+            array = array.base
+    assert np.array_equal(loaded.indices, written.indices)
+    assert np.array_equal(loaded.data, written.data)
+    assert np.allclose(load_neighbors(directory, 4).toarray(), _top_k_dense(expected, 4, 0.3), atol=1e-6)
+
+    # same data and a smaller k: served from the file
+    mtime = (tmp_path / 'neighbors' / 'data.npy').stat().st_mtime_ns
+    assert np.allclose(write_neighbors(values, directory, 4, 0.3).toarray(),
+                       _top_k_dense(expected, 4, 0.3), atol=1e-6)
+    assert (tmp_path / 'neighbors' / 'data.npy').stat().st_mtime_ns == mtime
+
+
+def test_item_knn_with_neighbor_dir_matches_in_memory(tmp_path):
+    frame = _ratings(5)
+    users, items, _ = _dense(frame)
+    in_memory = ItemKNN(4, save_nbrs=6).fit(frame)
+    mapped = ItemKNN(4, save_nbrs=6, neighbor_dir=str(tmp_path / 'nbrs')).fit(frame)
+    assert np.allclose(_predictions(mapped, users, items), _predictions(in_memory, users, items),
+                       equal_nan=True, atol=1e-6)
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from recsogood.metrics import _ndcg_table, nDCG_LK, ndcg_scores, topn_metrics
+
+
+def _reference_ndcg(n, top_items, test_items):
+    # the class the scripts used to define inline, IDCG taken at min(n, |truth|)
+    dcg = sum(1 / np.log2(rank + 1) for rank, item in enumerate(top_items, 1) if item in test_items)
+    idcg = sum(1 / np.log2(rank + 1) for rank in range(1, min(n, len(test_items)) + 1))
+    return dcg / idcg if idcg else 0
+
+
+def _frames(seed=0, n=10):
+    rng = np.random.default_rng(seed)
+    recs, truth = [], []
+    for user in range(40):
+        test = rng.choice(60, size=rng.integers(1, 25), replace=False)
+        truth += [(user, item) for item in test]
+        # some users get short lists or none, some lists miss the truth entirely
+        length = [0, 3, n, n][user % 4]
+        pool = np.arange(60, 120) if user % 5 == 0 else np.arange(60)
+        recs += [(user, item) for item in rng.choice(pool, size=length, replace=False)]
+    return pd.DataFrame(recs, columns=['user', 'item']), pd.DataFrame(truth, columns=['user', 'item'])
+
+
+def test_ndcg_table_matches_log_discount():
+    discount, idcg = _ndcg_table(10)
+    ranks = np.arange(1, 11)
+    assert np.allclose(discount, 1 / np.log2(ranks + 1))
+    assert np.allclose(idcg, np.cumsum(1 / np.log2(ranks + 1)))
+    assert not discount.flags.writeable
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_ndcg_scores_match_reference(seed):
+    recs, truth = _frames(seed)
+    scores, mean = ndcg_scores(recs, truth, n=10)
+
+    expected = {}
+    for user, user_truth in truth.groupby('user', sort=False):
+        top_items = recs.loc[recs['user'] == user, 'item'].tolist()
+        test_items = user_truth['item'].tolist()
+        expected[user] = _reference_ndcg(10, top_items, test_items)
+        assert nDCG_LK(10, top_items, test_items).calculate() == pytest.approx(expected[user])
+
+    assert list(scores.index) == list(expected)
+    assert np.allclose(scores.to_numpy(), list(expected.values()))
+    assert mean == pytest.approx(np.mean(list(expected.values())))
+
+    # users without hits and users without recommendations score 0
+    assert (scores[[u for u in expected if u % 5 == 0 or u % 4 == 0]] == 0).all()
+    # short lists are scored against IDCG@min(n, |truth|), not the list length
+    assert (scores[[u for u in expected if u % 4 == 1]] < 1).any()
+
+    per_user, _ = topn_metrics(recs, truth, cutoffs=(10,), metrics=('ndcg',))
+    assert np.allclose(per_user[('ndcg', 10)].to_numpy(), scores.to_numpy())
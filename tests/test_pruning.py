@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from recsogood.pruning import k_core, prune_k_core
+
+
+def _prune_loop(data, user_k, item_k):
+    # the scripts' prune_10_core loop, with separate user and item thresholds
+    while True:
+        user_counts = data['user'].value_counts()
+        data = data[data['user'].isin(user_counts[user_counts >= user_k].index)]
+        item_counts = data['item'].value_counts()
+        data = data[data['item'].isin(item_counts[item_counts >= item_k].index)]
+        if all(user_counts >= user_k) and all(item_counts >= item_k):
+            return data
+
+
+def _ratings(seed):
+    rng = np.random.default_rng(seed)
+    n = 3000
+    # skewed ids so several peeling rounds are needed
+    users = (rng.pareto(1.0, n) * 20).astype(np.int64) % 300
+    items = (rng.pareto(1.0, n) * 10).astype(np.int64) % 200
+    return pd.DataFrame({'user': users, 'item': items, 'rating': rng.integers(1, 6, n)})
+
+
+@pytest.mark.parametrize('seed', range(4))
+@pytest.mark.parametrize('user_k, item_k', [(10, None), (5, 5), (3, 8)])
+def test_prune_k_core_matches_loop(seed, user_k, item_k):
+    ratings = _ratings(seed)
+    expected = _prune_loop(ratings, user_k, user_k if item_k is None else item_k)
+
+    pruned, stats = prune_k_core(ratings, user_k, item_k)
+    pd.testing.assert_frame_equal(pruned, expected)
+    assert stats['removed_interactions'] == len(ratings) - len(expected)
+    assert stats['removed_users'] == ratings['user'].nunique() - expected['user'].nunique()
+    assert stats['removed_items'] == ratings['item'].nunique() - expected['item'].nunique()
+
+
+def test_k_core_accepts_string_ids():
+    ratings = _ratings(0)
+    keep, _ = k_core(ratings['user'].astype(str).to_numpy(), ('i' + ratings['item'].astype(str)).to_numpy(), 5)
+    assert np.array_equal(keep, ratings.index.isin(_prune_loop(ratings, 5, 5).index))
@@ -0,0 +1,35 @@
+from recsogood.cache import StageCache
+from recsogood.runner import StageGraph
+
+
+def _graph(cache, calls):
+    graph = StageGraph(cache)
+
+    def stage(name):
+        def fn(*inputs):
+            calls.append(name)
+            return (name,) + inputs
+        return fn
+
+    data = graph.add(('data',), stage('data'))
+    split = graph.add(('split',), stage('split'), data, cached=True)
+    stats = graph.add(('stats',), stage('stats'), data)
+    return graph, split, stats
+
+
+def test_stage_graph_releases_inputs_on_cache_hits(tmp_path):
+    cache = StageCache(str(tmp_path))
+    calls = []
+    graph, split, stats = _graph(cache, calls)
+    assert graph.get(split) == ('split', ('data',))
+    assert graph.get(stats) == ('stats', ('data',))
+    assert calls == ['data', 'split', 'stats']
+    assert ('data',) not in graph._results
+
+    # the rerun reads split from the cache and still drops data after stats
+    calls = []
+    graph, split, stats = _graph(cache, calls)
+    assert graph.get(split) == ('split', ('data',))
+    assert graph.get(stats) == ('stats', ('data',))
+    assert calls == ['data', 'stats']
+    assert ('data',) not in graph._results
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse as sps
+
+from recsogood.scoring import lenskit_top_n, recpack_factorization, top_n_items
+
+
+def _ratings(seed=0):
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({'user': rng.integers(0, 60, 1500), 'item': rng.integers(0, 80, 1500),
+                          'rating': rng.integers(1, 6, 1500).astype(np.float64)})
+    return frame.drop_duplicates(['user', 'item'], ignore_index=True)
+
+
+def test_top_n_items_matches_dense_argsort():
+    rng = np.random.default_rng(1)
+    users, items = rng.standard_normal((30, 4)), rng.standard_normal((50, 4))
+    seen = sps.random(30, 50, density=0.2, random_state=2, format='csr')
+    top = top_n_items(users, items, 10, seen, tile_cells=64, n_jobs=2)
+
+    scores = users @ items.T
+    scores[seen.nonzero()] = -np.inf
+    assert (top == np.argsort(-scores, axis=1, kind='stable')[:, :10]).all()
+
+
+def _recpack_model(seed=3):
+    # NMF-shaped embeddings (non-negative, items x components transposed) and a
+    # binary history with one user who has seen all but 5 of the 70 items
+    rng = np.random.default_rng(seed)
+    user_embedding, item_embedding = rng.random((40, 6)), rng.random((6, 70))
+    history = sps.random(40, 70, density=0.3, random_state=seed, format='lil')
+    history[0, 5:] = 1
+    history = sps.csr_matrix(history)
+    history.data[:] = 1
+    return user_embedding, item_embedding, history
+
+
+def _dense_top_n(user_embedding, item_embedding, history, n):
+    # RecPack's dense prediction with the pipeline's remove_history applied
+    predictions = sps.csr_matrix(user_embedding @ item_embedding)
+    predictions = (predictions - predictions.multiply(history)).toarray()
+    top = np.argsort(-predictions, axis=1, kind='stable')[:, :n]
+    return np.where(np.take_along_axis(predictions, top, axis=1) > 0, top, -1)
+
+
+def test_top_n_items_matches_dense_ranking_with_history_removed():
+    user_embedding, item_embedding, history = _recpack_model()
+    top = top_n_items(user_embedding, item_embedding.T, 10, history, tile_cells=64, n_jobs=2)
+    assert (top == _dense_top_n(user_embedding, item_embedding, history, 10)).all()
+    assert (top[0, 5:] == -1).all()
+
+
+def test_recpack_factorization_matches_dense_ranking_with_history_removed():
+    pytest.importorskip('recpack')
+    user_embedding, item_embedding, history = _recpack_model()
+    model = recpack_factorization('NMF', n=10, name='BlockedNMFTest')(num_components=6)
+    model.user_embedding_, model.item_embedding_ = user_embedding, item_embedding
+
+    predictions = model._predict(history)
+    predictions = (predictions - predictions.multiply(history)).toarray()
+    top = np.argsort(-predictions, axis=1, kind='stable')[:, :10]
+    top = np.where(np.take_along_axis(predictions, top, axis=1) > 0, top, -1)
+    assert (top == _dense_top_n(user_embedding, item_embedding, history, 10)).all()
+
+
+class _Bias:
+    # fitted ``lenskit.algorithms.bias.Bias`` attributes
+
+    def __init__(self, users, items, rng):
+        self.mean_ = 3.5
+        self.item_offsets_ = pd.Series(rng.standard_normal(len(items)), index=items)
+        self.user_offsets_ = pd.Series(rng.standard_normal(len(users)), index=users)
+
+
+class _MF:
+    # fitted LensKit MF model attributes, without LensKit
+
+    def __init__(self, bias, seed=5):
+        rng = np.random.default_rng(seed)
+        self.user_index_ = pd.Index(np.arange(100, 130))
+        self.item_index_ = pd.Index(np.arange(500, 560))
+        self.user_features_ = rng.standard_normal((30, 4))
+        self.item_features_ = rng.standard_normal((60, 4))
+        self.bias = _Bias(self.user_index_, self.item_index_, rng) if bias == 'fitted' else bias
+
+
+@pytest.mark.parametrize('bias', [None, False, 'fitted'])
+def test_lenskit_top_n_matches_dense_scores(bias):
+    model = _MF(bias)
+    rng = np.random.default_rng(6)
+    train = pd.DataFrame({'user': rng.choice(model.user_index_, 400),
+                          'item': rng.choice(model.item_index_, 400)})
+    users = [104, 117, 999]
+
+    scores = model.user_features_ @ model.item_features_.T
+    if bias == 'fitted':
+        scores += model.bias.mean_ + model.bias.item_offsets_.to_numpy()
+        scores += model.bias.user_offsets_.to_numpy()[:, None]
+    scores[model.user_index_.get_indexer(train['user']), model.item_index_.get_indexer(train['item'])] = -np.inf
+
+    recs = lenskit_top_n(model, users, 5, train, n_jobs=1)
+    assert set(recs['user']) == {104, 117}
+    for user, group in recs.groupby('user'):
+        row = scores[model.user_index_.get_loc(user)]
+        top = np.argsort(-row, kind='stable')[:5]
+        assert (group['item'].to_numpy() == model.item_index_[top]).all()
+        assert np.allclose(group['score'], row[top])
+        assert (group['rank'].to_numpy() == np.arange(1, 6)).all()
+
+
+@pytest.mark.parametrize('bias', [True, False])
+def test_lenskit_top_n_matches_batch_recommend(bias):
+    pytest.importorskip('lenskit')
+    from lenskit import batch
+    from lenskit.algorithms import Recommender
+    from lenskit.algorithms.als import BiasedMF
+
+    ratings = _ratings()
+    model = Recommender.adapt(BiasedMF(5, bias=bias, iterations=5, rng_spec=1))
+    model.fit(ratings)
+    users = ratings['user'].unique()[:20]
+
+    expected = batch.recommend(model, users, 10, n_jobs=1)
+    actual = lenskit_top_n(model, users, 10, ratings, n_jobs=1)
+    merged = expected.merge(actual, on=['user', 'rank'], suffixes=('', '_top_n'))
+    assert len(merged) == len(expected) == len(actual)
+    assert (merged['item'] == merged['item_top_n']).all()
+    assert np.allclose(merged['score'], merged['score_top_n'])
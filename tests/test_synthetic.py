@@ -0,0 +1,18 @@
+import numpy as np
+
+from recsogood.pruning import prune_k_core
+from recsogood.synthetic import SHAPES, synthetic_ratings
+
+
+def test_amazon_toys_keeps_its_10_core():
+    shape = SHAPES['amazon-toys']
+    ratings = synthetic_ratings('amazon-toys')
+    assert len(ratings) == shape['interactions']
+
+    pruned, _ = prune_k_core(ratings, 10)
+    assert abs(len(pruned) - shape['core10_interactions']) <= 0.25 * shape['core10_interactions']
+
+    # the Amazon scripts hold out 22.9% per user, rounded up, to get an 80/20 split
+    degrees = pruned.groupby('user').size().to_numpy()
+    held_out = (degrees - np.ceil(degrees * (1 - 0.229))).sum() / degrees.sum()
+    assert abs(held_out - 0.2) < 0.015